@@ -167,48 +167,105 @@
 #       SMUFF_TOOL_CHANGE T=11
 #---------------------------------------------------------------------------------------------
 
+import functools
 import logging
 
 from . import smuff_core			# main functions are located in this module
 IS_KLIPPER		= True 				# flag has to be set to True for Klipper
 
 # Wrapper class for logging with a prefix
-class SLogger:
+# Being a LoggerAdapter, info()/error()/debug()/exception() check the log level
+# first, so neither the prefix nor the '%' style arguments get formatted if the
+# record isn't going to be emitted at all
+class SLogger(logging.LoggerAdapter):
 	def __init__(self, prefix):
 		self._prefix = prefix
-		self._logger = None
 		if self._prefix == None: # create separate logfile
 			logHandler = logging.FileHandler(filename="/var/tmp/smuff.log", encoding="utf-8")
 			logHandler.setLevel(logging.DEBUG)
 			logFormat = logging.Formatter("%(asctime)s %(levelname)-7s: %(message)s")
 			logHandler.setFormatter(logFormat)
-			self._logger = logging.getLogger("SMuFF")
-			self._logger.addHandler(logHandler)
+			logger = logging.getLogger("SMuFF")
+			logger.addHandler(logHandler)
+		else: # log into klippy.log
+			logger = logging.getLogger()
+		logging.LoggerAdapter.__init__(self, logger, {})
 
-	def info(self, message):
-		if self._logger != None:
-			self._logger.info(message)
+	def process(self, message, kwargs):
+		if self._prefix:
+			return self._prefix + message, kwargs
+		return message, kwargs
 
-	def error(self, message):
-		if self._logger != None:
-			self._logger.error(message)
-
-	def debug(self, message):
-		if self._logger != None:
-			self._logger.debug(message)
+#
+# Decorator for GCode commands which need a connected SMuFF.
+# Selects the instance addressed by the command, bails out if it's not connected
+# and otherwise hands the instance over to the command as its 3rd argument.
+#
+def requires_connection(cmd):
+	@functools.wraps(cmd)
+	def wrapper(self, gcmd=None):
+		self.get_instance(gcmd)
+		inst = self._instance
+		if not inst.isConnected:
+			self._setResponse(smuff_core.T_NOT_CONN, False, inst)
+			return
+		return cmd(self, gcmd, inst)
+	return wrapper
 
 class SMuFF:
 
+	# GCode commands registered with Klipper: (command, handler method, help text)
+	_COMMANDS = (
+		("SMUFF_CONN",			"cmd_connect",			smuff_core.T_HELP_CONN),
+		("SMUFF_DISC",			"cmd_disconnect",		smuff_core.T_HELP_DISC),
+		("SMUFF_CONNECTED",		"cmd_connected",		smuff_core.T_HELP_CONNECTED),
+		("SMUFF_CUT",			"cmd_cut",				smuff_core.T_HELP_CUT),
+		("SMUFF_WIPE",			"cmd_wipe",				smuff_core.T_HELP_WIPE),
+		("SMUFF_LID_OPEN",		"cmd_lid_open",			smuff_core.T_HELP_LID_OPEN),
+		("SMUFF_LID_CLOSE",		"cmd_lid_close",		smuff_core.T_HELP_LID_CLOSE),
+		("SMUFF_SET_SERVO",		"cmd_servo_pos",		smuff_core.T_HELP_SET_SERVO),
+		("SMUFF_TOOL_CHANGE",	"cmd_tool_change",		smuff_core.T_HELP_TOOL_CHANGE),
+		("SMUFF_INFO",			"cmd_fw_info",			smuff_core.T_HELP_INFO),
+		("SMUFF_STATUS",		"cmd_get_states",		smuff_core.T_HELP_STATUS),
+		("SMUFF_SEND",			"cmd_gcode",			smuff_core.T_HELP_SEND),
+		("SMUFF_PARAM",			"cmd_param",			smuff_core.T_HELP_PARAM),
+		("SMUFF_MATERIALS",		"cmd_materials",		smuff_core.T_HELP_MATERIALS),
+		("SMUFF_SWAPS",			"cmd_swaps",			smuff_core.T_HELP_SWAPS),
+		("SMUFF_LIDMAPPINGS",	"cmd_lidmappings",		smuff_core.T_HELP_LIDMAPPINGS),
+		("SMUFF_LOAD",			"cmd_load",				smuff_core.T_HELP_LOAD),
+		("SMUFF_UNLOAD",		"cmd_unload",			smuff_core.T_HELP_UNLOAD),
+		("SMUFF_HOME",			"cmd_home",				smuff_core.T_HELP_HOME),
+		("SMUFF_MOTORS_OFF",	"cmd_motors_off",		smuff_core.T_HELP_MOTORS_OFF),
+		("SMUFF_CLEAR_JAM",		"cmd_clear_jam",		smuff_core.T_HELP_CLEAR_JAM),
+		("SMUFF_RESET",			"cmd_reset",			smuff_core.T_HELP_RESET),
+		("SMUFF_VERSION",		"cmd_version",			smuff_core.T_HELP_VERSION),
+		("SMUFF_RESET_AVG",		"cmd_reset_avg",		smuff_core.T_HELP_RESET_AVG),
+		("SMUFF_DUMP_RAW",		"cmd_dump_raw",			smuff_core.T_HELP_DUMP_RAW),
+		("SMUFF_DEBUG",			"cmd_dump_raw",			smuff_core.T_HELP_DUMP_RAW),
+		("SMUFF_INSTANCE",		"cmd_instance",			smuff_core.T_HELP_INSTANCE),
+		("SMUFF_GETINSTANCE",	"cmd_getinstance",		smuff_core.T_HELP_GETINSTANCE),
+		("SMUFF_TEST",			"cmd_test",				"")
+	)
+
+	# instance attributes (all set up in __init__)
+	__slots__ = (
+		"_log", "SCA", "SCB", "_activeInstance", "_instance", "_hasIDEX", "_ignoreDebug",
+		"_printer", "_reactor", "gcode", "pause_resume", "_lastActiveA", "_lastActiveB", "_prefixes", "_instances", "_respond"
+	)
+
 	def __init__(self, config, logger):
 		self._log 			= logger
 		self.SCA 			= smuff_core.SmuffCore(logger, IS_KLIPPER, self.smuffStatusCallbackA, self.smuffResponseCallbackA, config)
-		self.SCB 			= smuff_core.SmuffCore(logger, IS_KLIPPER, self.smuffStatusCallbackB, self.smuffResponseCallbackB, config)
+		self._hasIDEX 		= config.getboolean("hasIDEX", default=False)
+		# the 2nd SMuFF only exists on IDEX machines
+		self.SCB 			= smuff_core.SmuffCore(logger, IS_KLIPPER, self.smuffStatusCallbackB, self.smuffResponseCallbackB, config) if self._hasIDEX else None
+		self._instances 	= { "A": self.SCA, "B": self.SCB } if self._hasIDEX else { "A": self.SCA }
 		self._activeInstance = "A"
 		self._instance 		= self.SCA
-		self._hasIDEX 		= False
 		self._printer 		= config.get_printer()
 		self._reactor 		= self._printer.get_reactor()
 		self.gcode 			= self._printer.lookup_object("gcode")
+		self._respond 		= self.gcode.respond_info
 		self._lastActiveA 	= False
 		self._lastActiveB 	= False
 
@@ -219,8 +276,9 @@ class SMuFF:
 
 
 		# get configuration
-		self._ignoreDebug = config.get("ignoreDebug", default=smuff_core.T_NO).upper() == smuff_core.T_YES
-		self._hasIDEX = config.get("hasIDEX", default=smuff_core.T_NO).upper() == smuff_core.T_YES
+		self._ignoreDebug = config.getboolean("ignoreDebug", default=False)
+		# responses get tagged with the instance they're coming from only on IDEX machines
+		self._prefixes = { self.SCA: " [ A ]  ", self.SCB: " [ B ]  " } if self._hasIDEX else {}
 		serialPort = config.get("serial")
 		if not serialPort:
 			raise config.error(smuff_core.T_CFG_ERR)
@@ -229,10 +287,10 @@ class SMuFF:
 		self.SCA.timeout		= config.getfloat("serialTimeout", default=5.0)
 		self.SCA.cmdTimeout		= config.getfloat("commandTimeout", default=20.0)
 		self.SCA.tcTimeout		= config.getfloat("toolchangeTimeout", default=90.0)
-		self.SCA.autoConnect	= config.get("autoConnectSerial", default=smuff_core.T_YES).upper() == smuff_core.T_YES
-		self.SCA.hasCutter		= config.get("hasCutter", default=smuff_core.T_YES).upper() == smuff_core.T_YES 		# will be eventually overwritten by the SMuFF config
-		self.SCA.hasWiper 		= config.get("hasWiper", default=smuff_core.T_NO).upper() == smuff_core.T_YES
-		self.SCA.dumpRawData 	= config.get("debug", default=smuff_core.T_NO).upper() == smuff_core.T_YES
+		self.SCA.autoConnect	= config.getboolean("autoConnectSerial", default=True)
+		self.SCA.hasCutter		= config.getboolean("hasCutter", default=True) 		# will be eventually overwritten by the SMuFF config
+		self.SCA.hasWiper 		= config.getboolean("hasWiper", default=False)
+		self.SCA.dumpRawData 	= config.getboolean("debug", default=False)
 		self.SCA.wdTimeout 		= config.getfloat("watchdogTimeout", default=60)
 		self.SCA.ignoreDebug 	= self._ignoreDebug
 
@@ -245,9 +303,9 @@ class SMuFF:
 				self.SCB.timeout		= config.getfloat("serialTimeoutB", default=5.0)
 				self.SCB.cmdTimeout		= config.getfloat("commandTimeoutB", default=20.0)
 				self.SCB.tcTimeout		= config.getfloat("toolchangeTimeoutB", default=90.0)
-				self.SCB.autoConnect	= config.get("autoConnectSerialB", default=smuff_core.T_YES).upper() == smuff_core.T_YES
-				self.SCB.hasCutter		= config.get("hasCutterB", default=smuff_core.T_YES).upper() == smuff_core.T_YES 		# will be eventually overwritten by the SMuFF config
-				self.SCB.hasWiper 		= config.get("hasWiperB", default=smuff_core.T_NO).upper() == smuff_core.T_YES
+				self.SCB.autoConnect	= config.getboolean("autoConnectSerialB", default=True)
+				self.SCB.hasCutter		= config.getboolean("hasCutterB", default=True) 		# will be eventually overwritten by the SMuFF config
+				self.SCB.hasWiper 		= config.getboolean("hasWiperB", default=False)
 				self.SCB.dumpRawData 	= self.SCA.dumpRawData
 				self.SCB.wdTimeout 		= config.getfloat("watchdogTimeoutB", default=60)
 				self.SCB.ignoreDebug 	= self._ignoreDebug
@@ -258,35 +316,8 @@ class SMuFF:
 		self._printer.register_event_handler("klippy:ready", self.event_ready)
 
 		# register GCodes for SMuFF
-		self.gcode.register_command("SMUFF_CONN",           self.cmd_connect,     	smuff_core.T_HELP_CONN)
-		self.gcode.register_command("SMUFF_DISC",           self.cmd_disconnect,  	smuff_core.T_HELP_DISC)
-		self.gcode.register_command("SMUFF_CONNECTED",      self.cmd_connected,  	smuff_core.T_HELP_CONNECTED)
-		self.gcode.register_command("SMUFF_CUT",            self.cmd_cut,         	smuff_core.T_HELP_CUT)
-		self.gcode.register_command("SMUFF_WIPE",           self.cmd_wipe,        	smuff_core.T_HELP_WIPE)
-		self.gcode.register_command("SMUFF_LID_OPEN",       self.cmd_lid_open,    	smuff_core.T_HELP_LID_OPEN)
-		self.gcode.register_command("SMUFF_LID_CLOSE",      self.cmd_lid_close,   	smuff_core.T_HELP_LID_CLOSE)
-		self.gcode.register_command("SMUFF_SET_SERVO",      self.cmd_servo_pos,   	smuff_core.T_HELP_SET_SERVO)
-		self.gcode.register_command("SMUFF_TOOL_CHANGE",    self.cmd_tool_change, 	smuff_core.T_HELP_TOOL_CHANGE)
-		self.gcode.register_command("SMUFF_INFO",           self.cmd_fw_info,     	smuff_core.T_HELP_INFO)
-		self.gcode.register_command("SMUFF_STATUS",         self.cmd_get_states,  	smuff_core.T_HELP_STATUS)
-		self.gcode.register_command("SMUFF_SEND",           self.cmd_gcode,       	smuff_core.T_HELP_SEND)
-		self.gcode.register_command("SMUFF_PARAM",          self.cmd_param,       	smuff_core.T_HELP_PARAM)
-		self.gcode.register_command("SMUFF_MATERIALS",      self.cmd_materials,     smuff_core.T_HELP_MATERIALS)
-		self.gcode.register_command("SMUFF_SWAPS",      	self.cmd_swaps,     	smuff_core.T_HELP_SWAPS)
-		self.gcode.register_command("SMUFF_LIDMAPPINGS",   	self.cmd_lidmappings,   smuff_core.T_HELP_LIDMAPPINGS)
-		self.gcode.register_command("SMUFF_LOAD",   		self.cmd_load,   		smuff_core.T_HELP_LOAD)
-		self.gcode.register_command("SMUFF_UNLOAD",   		self.cmd_unload,   		smuff_core.T_HELP_UNLOAD)
-		self.gcode.register_command("SMUFF_HOME",   		self.cmd_home,   		smuff_core.T_HELP_HOME)
-		self.gcode.register_command("SMUFF_MOTORS_OFF", 	self.cmd_motors_off, 	smuff_core.T_HELP_MOTORS_OFF)
-		self.gcode.register_command("SMUFF_CLEAR_JAM",		self.cmd_clear_jam, 	smuff_core.T_HELP_CLEAR_JAM)
-		self.gcode.register_command("SMUFF_RESET",			self.cmd_reset, 		smuff_core.T_HELP_RESET)
-		self.gcode.register_command("SMUFF_VERSION",		self.cmd_version, 		smuff_core.T_HELP_VERSION)
-		self.gcode.register_command("SMUFF_RESET_AVG",		self.cmd_reset_avg, 	smuff_core.T_HELP_RESET_AVG)
-		self.gcode.register_command("SMUFF_DUMP_RAW",		self.cmd_dump_raw, 		smuff_core.T_HELP_DUMP_RAW)
-		self.gcode.register_command("SMUFF_DEBUG",			self.cmd_dump_raw, 		smuff_core.T_HELP_DUMP_RAW)
-		self.gcode.register_command("SMUFF_INSTANCE",		self.cmd_instance, 		smuff_core.T_HELP_INSTANCE)
-		self.gcode.register_command("SMUFF_GETINSTANCE",	self.cmd_getinstance, 	smuff_core.T_HELP_GETINSTANCE)
-		self.gcode.register_command("SMUFF_TEST",			self.cmd_test, 			"")
+		for command, handler, helpText in self._COMMANDS:
+			self.gcode.register_command(command, getattr(self, handler), helpText)
 
 	def autoConnect(self):
 		if self.SCA.autoConnect:
@@ -298,14 +329,14 @@ class SMuFF:
 
 	def smuffStatusCallbackA(self, active):
 		if self._lastActiveA != active:
-			self._log.info("[ A ]  active state switched from {0} to {1}".format(self._lastActiveA, active))
+			self._log.info("[ A ]  active state switched from %s to %s", self._lastActiveA, active)
 			self._lastActiveA = active
 			if active == False:
 				self._setResponse("Serial reader has shut down", False, self.SCA)
 
 	def smuffStatusCallbackB(self, active):
 		if self._lastActiveB != active:
-			self._log.info("[ B ]  active state switched from {0} to {1}".format(self._lastActiveB, active))
+			self._log.info("[ B ]  active state switched from %s to %s", self._lastActiveB, active)
 			self._lastActiveB = active
 			if active == False:
 				self._setResponse("Serial reader has shut down", False, self.SCB)
@@ -320,11 +351,8 @@ class SMuFF:
 	# Send a response (text) to Klipper GCode panel
 	#
 	def _setResponse(self, response, addPrefix = False, instance = None):
-		fromInst = ""
-		if self._hasIDEX and not instance == None:
-			fromInst = " [ A ]  " if instance == self.SCA else " [ B ]  "
-		if response != "":
-			self.gcode.respond_info(fromInst + response)
+		if response:
+			self._respond(self._prefixes.get(instance, "") + response)
 
 	def _reset(self):
 		self._log.info("Resetting module")
@@ -337,7 +365,8 @@ class SMuFF:
 		# it'll interfere with the new instance after firmware restart
 		self._log.info("Klippy has disconnected, closing serial communication to SMuFF")
 		self.SCA.close_serial()
-		self.SCB.close_serial()
+		if self.SCB:
+			self.SCB.close_serial()
 
     #
     # Klippy connect handler
@@ -363,25 +392,19 @@ class SMuFF:
 
 
 	def get_instance(self, gcmd=None):
-		if gcmd:
-			device = gcmd.get(smuff_core.P_DEVICE, default="A").upper()
-			if device == "A" or device == "B":
-				self._activeInstance = device
-			else:
-				self.gcode.respond_info(smuff_core.T_INVALID_DEVICE)
+		# the first device is the default
+		device = gcmd.get(smuff_core.P_DEVICE, default="A").upper() if gcmd else "A"
+		instance = self._instances.get(device)
+		if instance is None:
+			self.gcode.respond_info(smuff_core.T_NO_IDEX if device == "B" else smuff_core.T_INVALID_DEVICE)
+			instance = self._instances[self._activeInstance]
 		else:
-			self._activeInstance = "A"  # make the first device the default
-		self._instance = self.SCA if self._activeInstance == "A" else self.SCB
+			self._activeInstance = device
+		self._instance = instance
 
 	def set_instance(self, inst):
 		self._activeInstance = inst
-
-	def chk_connection(self, gcmd=None):
-		self.get_instance(gcmd)
-		if not self._instance.isConnected:
-			self._setResponse(smuff_core.T_NOT_CONN, False, self._instance)
-			return False
-		return True
+		self._instance = self._instances[inst]
 
     #
     # SMUFF_CONN
@@ -420,69 +443,62 @@ class SMuFF:
     #
     # SMUFF_CUT
     #
-	def cmd_cut(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		self._setResponse(smuff_core.T_CUTTING, False, self._instance)
-		self._instance.send_SMuFF(smuff_core.CUT)
+	@requires_connection
+	def cmd_cut(self, gcmd, inst):
+		self._setResponse(smuff_core.T_CUTTING, False, inst)
+		inst.send_SMuFF(smuff_core.CUT)
 
     #
     # SMUFF_WIPE
     #
-	def cmd_wipe(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		self._setResponse(smuff_core.T_WIPING, False, self._instance)
-		self._instance.send_SMuFF(smuff_core.WIPE)
+	@requires_connection
+	def cmd_wipe(self, gcmd, inst):
+		self._setResponse(smuff_core.T_WIPING, False, inst)
+		inst.send_SMuFF(smuff_core.WIPE)
 
     #
     # SMUFF_LID_OPEN
     #
-	def cmd_lid_open(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		self._setResponse(smuff_core.T_OPENING_LID, False, self._instance)
-		self._instance.send_SMuFF(smuff_core.LIDOPEN)
+	@requires_connection
+	def cmd_lid_open(self, gcmd, inst):
+		self._setResponse(smuff_core.T_OPENING_LID, False, inst)
+		inst.send_SMuFF(smuff_core.LIDOPEN)
 
     #
     # SMUFF_LID_CLOSE
     #
-	def cmd_lid_close(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		self._setResponse(smuff_core.T_CLOSING_LID, False, self._instance)
-		self._instance.send_SMuFF(smuff_core.LIDCLOSE)
+	@requires_connection
+	def cmd_lid_close(self, gcmd, inst):
+		self._setResponse(smuff_core.T_CLOSING_LID, False, inst)
+		inst.send_SMuFF(smuff_core.LIDCLOSE)
 
     #
     # SMUFF_SET_SERVO
     #
-	def cmd_servo_pos(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
+	@requires_connection
+	def cmd_servo_pos(self, gcmd, inst):
 		if gcmd:
 			servo = gcmd.get_int(smuff_core.P_SERVO, default=1) 	# Lid servo by default
 			pos = gcmd.get_int(smuff_core.P_ANGLE, default=90)
-			if pos < 0 or pos > 180:
+			if not 0 <= pos <= 180:
 				gcmd.respond_info(smuff_core.T_ERR_SERVOPOS)
 				return
-			self._setResponse(smuff_core.T_POSITIONING.format(servo, pos), False, self._instance)
-			self._instance.send_SMuFF(smuff_core.SETSERVO.format(servo, pos))
+			self._setResponse(smuff_core.T_POSITIONING % (servo, pos), False, inst)
+			inst.send_SMuFF(smuff_core.SETSERVO % (servo, pos))
 
     #
     # SMUFF_TOOL_CHANGE
     #
-	def cmd_tool_change(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		self._instance.klipper_change_tool(gcmd)
+	@requires_connection
+	def cmd_tool_change(self, gcmd, inst):
+		inst.klipper_change_tool(gcmd)
 
     #
     # SMUFF_INFO
     #
-	def cmd_fw_info(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		self._setResponse(smuff_core.T_FW_INFO.format(self._instance.get_fw_info()), False, self._instance)
+	@requires_connection
+	def cmd_fw_info(self, gcmd, inst):
+		self._setResponse(smuff_core.T_FW_INFO.format(inst.get_fw_info()), False, inst)
 
     #
     # SMUFF_STATUS
@@ -495,9 +511,8 @@ class SMuFF:
     #
     # SMUFF_SEND
     #
-	def cmd_gcode(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
+	@requires_connection
+	def cmd_gcode(self, gcmd, inst):
 		if gcmd == None:
 			return
 		gcode = gcmd.get(smuff_core.P_GCODE)
@@ -505,18 +520,17 @@ class SMuFF:
 			gcmd.respond_info(smuff_core.T_NO_PARAM.format(smuff_core.P_GCODE))
 			return
 		if gcode.upper() == smuff_core.RESET:
-			self._instance.send_SMuFF(gcode)
+			inst.send_SMuFF(gcode)
 		else:
-			response = self._instance.send_SMuFF_and_wait(gcode)
+			response = inst.send_SMuFF_and_wait(gcode)[0]
 			if response:
 				gcmd.respond_info(smuff_core.T_SMUFF_RESPONSE.format(response))
 
     #
     # SMUFF_PARAM
     #
-	def cmd_param(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
+	@requires_connection
+	def cmd_param(self, gcmd, inst):
 		if gcmd == None:
 			return
 		param = gcmd.get(smuff_core.P_PARAM)
@@ -527,20 +541,18 @@ class SMuFF:
 		if not paramVal:
 			gcmd.respond_info(smuff_core.T_NO_VALUE.format(smuff_core.P_PARAMVAL))
 			return
-		response = self._instance.send_SMuFF_and_wait(smuff_core.SETPARAM.format(param, paramVal))
-		if self._instance.isError:
-			gcmd.respond_info(smuff_core.T_SMUFF_ERR.format(response))
+		response, isError = inst.send_SMuFF_and_wait(smuff_core.SETPARAM % (param, paramVal))
+		if isError:
+			gcmd.respond_info(smuff_core.T_SMUFF_ERR.format(response or ""))
 
     #
     # SMUFF_MATERIALS
     #
-	def cmd_materials(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		inst = self._instance
-		response = inst.send_SMuFF_and_wait(smuff_core.GETCONFIG.format(smuff_core.CFG_MATERIALS))
+	@requires_connection
+	def cmd_materials(self, gcmd, inst):
+		response, isError = inst.send_SMuFF_and_wait(smuff_core.GETCONFIG % smuff_core.CFG_MATERIALS)
 		# print materials to console
-		if response:
+		if response and not isError:
 			for i in range(inst.toolCount):
 				material = inst.materials[i]
 				self._setResponse("Tool {0} is '{2} {1}' with a purge factor of {3}%".format(i, material[0], material[1], material[2]), False, inst)
@@ -548,13 +560,11 @@ class SMuFF:
     #
     # SMUFF_SWAPS
     #
-	def cmd_swaps(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		inst = self._instance
-		response = inst.send_SMuFF_and_wait(smuff_core.GETCONFIG.format(smuff_core.CFG_SWAPS))
+	@requires_connection
+	def cmd_swaps(self, gcmd, inst):
+		response, isError = inst.send_SMuFF_and_wait(smuff_core.GETCONFIG % smuff_core.CFG_SWAPS)
 		# print swaps to console
-		if response:
+		if response and not isError:
 			for i in range(inst.toolCount):
 				slot = inst.swaps[i]
 				self._setResponse("Tool {0} is assigned to slot {1}".format(i, slot), False, inst)
@@ -562,13 +572,11 @@ class SMuFF:
     #
     # SMUFF_LIDMAPPINGS
     #
-	def cmd_lidmappings(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		inst = self._instance
-		response = inst.send_SMuFF_and_wait(smuff_core.GETCONFIG.format(smuff_core.CFG_SERVOMAPS))
+	@requires_connection
+	def cmd_lidmappings(self, gcmd, inst):
+		response, isError = inst.send_SMuFF_and_wait(smuff_core.GETCONFIG % smuff_core.CFG_SERVOMAPS)
 		# print lid mappings to console
-		if response:
+		if response and not isError:
 			for i in range(inst.toolCount):
 				servoMap = inst.servoMaps[i]
 				self._setResponse("Tool {0} is closed @ {1} deg.".format(i, servoMap), False, inst)
@@ -576,62 +584,54 @@ class SMuFF:
     #
     # SMUFF_LOAD
     #
-	def cmd_load(self, gcmd=None):
-		if not self.chk_connection(gcmd):
+	@requires_connection
+	def cmd_load(self, gcmd, inst):
+		if inst.is_waiting_for_ok():
+			self._setResponse(smuff_core.T_NOT_READY, False, inst)
 			return
-		if not self._instance._okTimer is None:
-			self._setResponse(smuff_core.T_NOT_READY, False, self._instance)
-			return
-		activeTool = self._instance.get_active_tool()
+		activeTool = inst.get_active_tool()
 		if activeTool != -1:
-			self._instance.send_SMuFF(smuff_core.LOADFIL)
-			self._instance._okTimer = self._reactor.register_timer(self._instance.wait_for_ok, self._reactor.NOW + 5.0)
+			inst.send_and_wait_for_ok(smuff_core.LOADFIL)
 
     #
     # SMUFF_UNLOAD
     #
-	def cmd_unload(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		if not self._instance._okTimer is None:
-			self._setResponse(smuff_core.T_NOT_READY, False, self._instance)
+	@requires_connection
+	def cmd_unload(self, gcmd, inst):
+		if inst.is_waiting_for_ok():
+			self._setResponse(smuff_core.T_NOT_READY, False, inst)
 			return
-		activeTool = self._instance.get_active_tool()
+		activeTool = inst.get_active_tool()
 		if activeTool != -1:
-			self._instance.send_SMuFF(smuff_core.UNLOADFIL)
-			self._instance._okTimer = self._reactor.register_timer(self._instance.wait_for_ok, self._reactor.NOW + 5.0)
+			inst.send_and_wait_for_ok(smuff_core.UNLOADFIL)
 
     #
     # SMUFF_HOME
     #
-	def cmd_home(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		self._instance.send_SMuFF(smuff_core.HOME)
+	@requires_connection
+	def cmd_home(self, gcmd, inst):
+		inst.send_SMuFF(smuff_core.HOME)
 
     #
     # SMUFF_MOTORS_OFF
     #
-	def cmd_motors_off(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		self._instance.send_SMuFF(smuff_core.MOTORSOFF)
+	@requires_connection
+	def cmd_motors_off(self, gcmd, inst):
+		inst.send_SMuFF(smuff_core.MOTORSOFF)
 
     #
     # SMUFF_CLEAR_JAM
     #
-	def cmd_clear_jam(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		self._instance.send_SMuFF(smuff_core.UNJAM)
+	@requires_connection
+	def cmd_clear_jam(self, gcmd, inst):
+		inst.send_SMuFF(smuff_core.UNJAM)
 
     #
     # SMUFF_RESET
     #
-	def cmd_reset(self, gcmd=None):
-		if not self.chk_connection(gcmd):
-			return
-		self._instance.send_SMuFF(smuff_core.RESET)
+	@requires_connection
+	def cmd_reset(self, gcmd, inst):
+		inst.send_SMuFF(smuff_core.RESET)
 
     #
     # SMUFF_VERSION
@@ -653,7 +653,8 @@ class SMuFF:
     #
 	def cmd_dump_raw(self, gcmd=None):
 		self.SCA.dumpRawData = not self.SCA.dumpRawData
-		self.SCB.dumpRawData = not self.SCB.dumpRawData
+		if self.SCB:
+			self.SCB.dumpRawData = self.SCA.dumpRawData
 		self.gcode.respond_info(smuff_core.T_DUMP_RAW.format(smuff_core.T_ON if self.SCA.dumpRawData else smuff_core.T_OFF))
 
     #
@@ -666,7 +667,7 @@ class SMuFF:
 		if gcmd == None:
 			return
 		param = gcmd.get(smuff_core.P_PARAMVAL).upper()
-		if param == "A" or param == "B":
+		if param in self._instances:
 			self.set_instance(param)
 		else:
 			self.gcode.respond_info(smuff_core.T_INVALID_DEVICE)
@@ -699,15 +700,14 @@ class SMuFF:
 # Main entry point; Creates a new instance of this module.
 #
 def load_config(config):
-	#logger = SLogger("SMuFF: {0}")
+	#logger = SLogger("SMuFF: ")
 	logger = SLogger(None)
 
+	# configuration errors are left to Klipper, which reports them properly
+	instance = SMuFF(config, logger)
+	logger.info("Module instance successfully created")
 	try:
-		instance = SMuFF(config, logger)
-		logger.info("Module instance successfully created")
-		if instance:
-			instance.autoConnect()
-		return instance
+		instance.autoConnect()
 	except Exception as err:
-		logger.error("Unable to create module instance.\n\t{0}".format(err))
-		return None
+		logger.error("Unable to auto connect to SMuFF.\n\t%s", err)
+	return instance
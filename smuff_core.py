@@ -1,17 +1,19 @@
 from threading import Thread, Event
-from pprint import pformat
+from queue import SimpleQueue, Empty
 
+import functools
 import json
 import re
 import time
 import sys
-import traceback
 import logging
 
+serial = None							# pySerial, imported as soon as a serial port gets opened
+
 try:
-    import serial
+	from orjson import loads as _json_loads	# much faster, if available
 except ImportError:
-    logging.critical("SMuFF: Python library 'pySerial' is missing. Please use 'pip install pyserial' first!")
+	from json import loads as _json_loads
 
 VERSION_NUMBER 	= 1.16 					# Module version number (for scripting)
 VERSION_DATE 	= "2023/12/14"
@@ -23,13 +25,13 @@ OPT_ON 			= " S1"					# SMuFF GCode option for turning features on
 OPT_OFF			= " S0"					# SMuFF GCode option for turning features off
 WIPE			= "G12"					# SMuFF GCode to wipe nozzle
 CUT				= "G12 C"				# SMuFF GCode to cut filament
-SETSERVO		= "M280 P{0} S{1}"		# SMuFF GCode to position a servo
+SETSERVO		= "M280 P%d S%d"		# SMuFF GCode to position a servo
 LIDOPEN			= "M280 R0"				# SMuFF GCode to open Lid servo
 LIDCLOSE		= "M280 R1"				# SMuFF GCode to close lid servo
 TOOL			= "T"					# SMuFF GCode to swap tools
 HOME 			= "G28"					# SMuFF GCode for homing
-GETCONFIG 		= "M503 S{0}W"			# SMuFF Gcode to query configuration settings (in JSON format)
-SETPARAM 		= "M205 P\"{0}\"S{1}"	# SMuFF GCode for setting config params
+GETCONFIG 		= "M503 S%dW"			# SMuFF Gcode to query configuration settings (in JSON format)
+SETPARAM 		= "M205 P\"%s\"S%s"	# SMuFF GCode for setting config params
 LOADFIL			= "M700"				# SMuFF GCode to load active tool
 UNLOADFIL		= "M701"				# SMuFF GCode to unload active tool
 MOTORSOFF		= "M18"					# SMuFF GCode to turn stepper motors off
@@ -41,9 +43,13 @@ FAN_OFF 		= "M107"				# SMuFF GCode to turn off housing fan
 ANY 			= "ANY"
 EXTRUDE			= "G1 E{0} F{1}"		# Gcode for extrusion (used along with purging)
 
+# Fixed commands above, already encoded and terminated for sending
+ENCODED			= { cmd: (cmd + "\n").encode("ascii") for cmd in (FWINFO, PERSTATE + OPT_ON, WIPE, CUT, LIDOPEN, LIDCLOSE, HOME, LOADFIL, UNLOADFIL, MOTORSOFF, UNJAM, RESET) }
+
 # Texts used in console response
 T_OK 				= "Ok."
 T_ON				= "ON"
+T_ON_LC				= T_ON.lower()		# as sent by the SMuFF in its states
 T_OFF				= "OFF"
 T_YES 				= "YES"
 T_NO 				= "NO"
@@ -83,7 +89,7 @@ T_WIPING			= "Wiping nozzle..."
 T_CUTTING			= "Cutting filament..."
 T_OPENING_LID		= "Opening lid..."
 T_CLOSING_LID		= "Closing lid..."
-T_POSITIONING		= "Positioning servo {0} to {1} deg."
+T_POSITIONING		= "Positioning servo %d to %d deg."
 T_MOTORS_OFF 		= "Motors have been turned off"
 T_FAN 				= "Housing fan turned {0}"
 T_UNJAMMED 			= "Jam flag has been reset"
@@ -93,32 +99,32 @@ T_UNLOADING 		= "Unloading filament..."
 T_NOT_READY 		= "Busy with other async task, aborting!"
 T_RESETAVG 			= "Tool change statistics have been reset."
 T_STATE_INFO_NC		= """SMuFF Status:
-Connected:\t{0}
-Port:\t\t{1}"""
-T_STATE_INFO		= """{0}
+Connected:\t%s
+Port:\t\t%s"""
+T_STATE_INFO		= """%s
 ------------------------
-Device name:\t{1}
-Tool count:\t{2}
+Device name:\t%s
+Tool count:\t%s
 ------------------------
-Active tool:\t{3}
-Selector:\t{4}
-Feeder:\t\t{5}
-Feeder 2:\t{6}
-Lid:\t\t{7}
-Relay state:\t{8}
-SD-Card:\t{9}
-Idle:\t\t{10}
-Config changed:\t{11}
-Feeder loaded:\t{12}
-Feeder jammed:\t{13}
+Active tool:\t%s
+Selector:\t%s
+Feeder:\t\t%s
+Feeder 2:\t%s
+Lid:\t\t%s
+Relay state:\t%s
+SD-Card:\t%s
+Idle:\t\t%s
+Config changed:\t%s
+Feeder loaded:\t%s
+Feeder jammed:\t%s
 ------------------------
-FW-Version:\t{14}
-FW-Board:\t{15}
-FW-Mode:\t{16}
-FW-Options:\t{17}
+FW-Version:\t%s
+FW-Board:\t%s
+FW-Mode:\t%s
+FW-Options:\t%s
 ------------------------
-Tool changes:\t{18}
-Avg. duration:\t{19:4.2f} secs.\n"""
+Tool changes:\t%s
+Avg. duration:\t%4.2f secs.\n"""
 T_SET_PURGE 		= "Purge {0} mm after tool change has been set"
 T_RESET_PURGE 		= "Purge has been reset"
 T_PURGING 			= "Purging {0} mm with speed {1} mm/s"
@@ -156,8 +162,8 @@ T_HELP_INSTANCE 	= "Switches the active SMUFF instance on an IDEX machine."
 T_HELP_GETINSTANCE 	= "Reports the active SMUFF instance on an IDEX machine."
 
 # Response strings coming from SMuFF
-R_START			= "start\n"
-R_OK			= "ok\n"
+R_START			= "start"
+R_OK			= "ok"
 R_ECHO			= "echo:"
 R_DEBUG			= "dbg:"
 R_ERROR			= "error:"
@@ -167,6 +173,31 @@ R_UNKNOWNCMD	= "Unknown command:"
 R_JSON			= "{"
 R_JSONCAT		= "/*"
 R_FWINFO		= "FIRMWARE_"
+# field names in the firmware info and the attributes their values go to (None = not stored)
+R_FWINFO_FIELDS	= {
+	"FIRMWARE_NAME:":		None,
+	"FIRMWARE_VERSION:":	"fwVersion",
+	"ELECTRONICS:":			"fwBoard",
+	"DATE:":				None,
+	"MODE:":				"fwMode",
+	"OPTIONS:":				"fwOptions"
+}
+
+# Regular expressions used for parsing SMuFF responses (compiled only once at load time)
+RE_ESC			= re.compile(r'\033\[\d+m')								# ESC sequences in debug responses
+
+# On/off states sent periodically by the SMuFF and the attributes they're stored in
+STATE_FLAGS		= {
+	"S:":		"selector",			# Selector endstop state
+	"R:":		"revolver",			# Revolver endstop state
+	"F:":		"feeder",			# Feeder endstop state
+	"F2:":		"feeder2",			# DDE-Feeder endstop state
+	"SD:":		"sdcard",			# SD-Card state
+	"SC:":		"cfgChange",		# Settings Changed
+	"LID:":		"lid",				# Lid state
+	"I:":		"isIdle",			# Idle state
+	"JAM:":		"isJammed"			# Feeder jammed flag
+}
 
 # Some keywords sent by the SMuFF (as JSON config header)
 C_BASIC 		= "basic"
@@ -185,6 +216,18 @@ CFG_MATERIALS	= 5
 CFG_SWAPS 		= 6
 CFG_FEEDSTATE	= 8
 
+# Queries sent by _async_init, indexed by the init state (each answer advances the state)
+INIT_QUERIES	= (
+	None,
+	GETCONFIG % CFG_BASIC,				# basic configuration settings
+	GETCONFIG % CFG_MATERIALS,			# materials configuration
+	FWINFO,								# firmware info
+	GETCONFIG % CFG_SWAPS,				# tool swap configuration settings
+	GETCONFIG % CFG_SERVOMAPS			# lid servo mapping settings
+)
+# configuration queries are fixed commands as well (see ENCODED)
+ENCODED.update({ GETCONFIG % cfg: (GETCONFIG % cfg + "\n").encode("ascii") for cfg in (CFG_BASIC, CFG_SERVOMAPS, CFG_MATERIALS, CFG_SWAPS, CFG_FEEDSTATE) })
+
 # Action commands coming from/sent to the SMuFF
 ACTION_CMD		= "//action:"
 ACTION_WAIT		= "WAIT"
@@ -193,6 +236,11 @@ ACTION_ABORT	= "ABORT"
 ACTION_PING		= "PING"
 ACTION_PONG		= "PONG"
 
+# Offsets of the payload within responses (prefix plus separator)
+ECHO_LEN		= len(R_ECHO)+1
+ERROR_LEN		= len(R_ERROR)+1
+ACTION_LEN		= len(ACTION_CMD)
+
 # Klipper printer states
 ST_IDLE			= "Idle"
 ST_PRINTING		= "Printing"
@@ -212,12 +260,143 @@ P_DEVICE		= "DEV"				# used for device switching (A/B)
 # GCode macros called
 PRE_TC 			= "PRE_TOOLCHANGE"
 POST_TC 		= "POST_TOOLCHANGE"
-G_PRE_TC 		= PRE_TC +" T={0}"
-G_POST_TC 		= POST_TC +" P={0} T={1}"
+G_PRE_TC 		= PRE_TC +" T=%d"
+G_POST_TC 		= POST_TC +" P=%d T=%d"
+
+# Load state texts, indexed by loadState + 1 (state 1 depends on the Splitter option, see get_states)
+LOAD_STATES		= (T_NO_TOOL, T_NO, None, T_YES, T_TO_DDE)
+
+# Delays between the attempts of the serial connector (doubled on each failed attempt)
+CONN_RETRY_MIN	= 0.5
+CONN_RETRY_MAX	= 10.0
+
+# Pre-built tool names "T-1" ... "T11" (index is tool number + 1)
+MAX_TOOLS		= 12
+TOOL_DIGITS		= "-0123456789"		# characters of a tool number
+TOOL_NAMES		= tuple(sys.intern(TOOL + str(i)) for i in range(-1, MAX_TOOLS))
+
+#
+# Converts a tool number into its name 'Tn'.
+#
+def tool_name(tool):
+	if -1 <= tool < MAX_TOOLS:
+		return TOOL_NAMES[tool+1]
+	return TOOL + str(tool)
+
+#
+# Converts the string 'Tn' into a tool number.
+# Results are cached, since only a handful of different tool strings ever show up.
+#
+@functools.lru_cache(maxsize=32)
+def parse_tool(tool):
+	# the number is the first run of digits (and minus signs), i.e. "-1" in "T-1"
+	end = len(tool)
+	start = 0
+	while start < end and not tool[start] in TOOL_DIGITS:
+		start += 1
+	stop = start
+	while stop < end and tool[stop] in TOOL_DIGITS:
+		stop += 1
+	return int(tool[start:stop])
+
+#
+# Retrieves the time in milliseconds (monotonic, for measuring durations only)
+#
+def now_ms():
+	return time.monotonic_ns() // 1000000
 
 
 class SmuffCore():
 
+	# default values for the resettable state (see _reset)
+	_DEFAULTS = {
+		"serialPort":				None,		# serial port device name
+		"baudrate":					0,			# serial port baudrate
+		"timeout":					0.0,			# communication timeout
+		"cmdTimeout":				0.0,			# command timeout
+		"tcTimeout":				0.0,			# tool change timeout
+		"wdTimeout":				60.0,		# watchdog timeout
+		"toolCount":				0,			# number of tools on the SMuFF
+		"autoConnect":				False,		# flag, whether or not to connect at startup
+		"dumpRawData":				False,		# for debugging only
+		"fwInfo":					"?",			# SMuFFs firmware info
+		"curTool":					TOOL_NAMES[0],	# the current tool
+		"preTool":					TOOL_NAMES[0],	# the previous tool
+		"pendingTool":				-1,			# the tool on a pending tool change
+		"selector":					False,		# status of the Selector endstop
+		"revolver":					False,		# status of the Revolver endstop
+		"feeder":					False,		# status of the Feeder endstop
+		"feeder2":					False,		# status of the 2nd Feeder endstop
+		"isBusy":					False,		# flag set when SMuFF signals "Busy"
+		"isError":					False,		# flag set when SMuFF signals "Error"
+		"isProcessing":				False,		# set when SMuFF is supposed to be busy
+		"waitRequested":			False,		# set when SMuFF requested a "Wait" (in case of jams or similar)
+		"abortRequested":			False,		# set when SMuFF requested a "Abort"
+		"isConnected":				False,		# set after connection has been established
+		"isAligned":				False,		# flag set when Feeder endstop is reached (not used yet)
+		"isDDE":					False,		# flag whether the SMuFF is configured for DDE
+		"hasSplitter":				False,		# flag whether the SMuFF is configured for the Splitter option
+		"hasCutter":				False,		# flag whether the SMuFF is configured for the Cutter option
+		"hasWiper":					False,		# flag whether the SMuFF is configured for the Wiper option
+		"sdcard":					False,		# set to True when SD-Card on SMuFF was removed
+		"cfgChange":				False,		# set to True when SMuFF configuration has changed
+		"lid":						False,		# set to True when Lid on SMuFF is open
+		"isIdle":					False,		# set to True when SMuFF is idle
+		"usesTmc":					False,		# set to True when SMuFF uses TMC drivers
+		"tmcWarning":				False,		# set to True when TMC drivers on SMuFF report warnings
+		"device":					"",			# current name of the SMuFF
+		"tcCount":					0,			# number of tool changes in total (since reset)
+		"durationTotal":			0.0,			# duration of all tool changes (for calculating average)
+		"loadState":				0,			# load state of the current tool
+		"fwVersion":				None,		# firmware version on the SMuFF (i.e. "V3.10D")
+		"fwBoard":					None,		# board the SMuFF is running on (i.e. "SKR E3-DIP V1.1")
+		"fwMode":					None,		# firmware mode on the SMuFF (i.e. "SMUFF" or "PMMU2")
+		"fwOptions":				None,		# firmware options installed on the SMUFF (i.e "TMC|NEOPIXELS|DDE|...")
+		"relay":					None,		# state of the relay E(xternal) or I(nternal)
+		"isJammed":					False,		# flag set when feeder is jammed
+		"ignoreDebug":				True,		# ignore any debug messages coming from SMuFF
+
+		"_serial":					None,		# serial instance
+		"_lastSerialEvent":			0,			# last time (in millis) a serial receive took place
+		"_wdLastAlive":				0.0,		# last sign of life for the serial watchdog (monotonic seconds)
+		"_awaitResponse":			False,		# set while send_SMuFF_and_wait() is waiting for a response
+		"_isReconnect":				False,		# set when trying to re-establish serial connection
+		"_autoLoad":				True,		# set to load new filament automatically after swapping tools
+		"_sreader":					None,		# serial reader thread instance
+		"_sconnector":				None,		# serial connector thread instance (standalone)
+		"_connTimer":				None,		# (reactor) timer retrying to connect (Klipper)
+		"_connDelay":				CONN_RETRY_MIN,	# current delay of the connector timer
+		"_connFailed":				False,		# set once the connector has reported a failed attempt
+		"_swatchdog":				None,		# serial watchdog thread instance
+		"_swriter":					None,		# serial writer thread instance
+		"_jsonCat":					None,		# category of the last JSON string received
+		"_stCount":					0,			# counter for states recevied
+		"_tcStartTime":				0,			# time for tool change duration measurement
+		"_initStartTime":			0,			# time for _init_SMuFF timeout checking
+		"_okTimer":					None,		# (reactor) timer waiting for OK response
+		"_okArmed":					False,		# flag if the OK timer is currently waiting
+		"_tcTimer":					None,		# (reactor) timer waiting for toolchange to finish
+		"_tcState":					0,			# tool change state
+		"_initState":				0,			# state for _init_SMuFF
+		"_lastCmdSent":				None,		# GCode of the last command sent to SMuFF
+		"_lastCmdDone":				False,		# flag if the last command sent has got a response
+		"_wdTimeoutDef":			60.0,		# default timeout for the serial port watchdog in seconds
+		"_idleTimeout":				None,		# Klipper's idle_timeout object (looked up on first use)
+		"_pauseResume":				None,		# Klipper's pause_resume object (looked up on first use)
+		"_heater":					None,		# Klipper's heater object (looked up on first use)
+		"_toolKeys":				(),			# JSON keys ("T0", "T1", ...) for all tools, set along with toolCount
+		"_curToolNum":				-1,			# number of the current tool (curTool parsed)
+	}
+
+	# instance attributes: the defaults above, the mutable values set up in _reset
+	# and the ones initialized in __init__ / during operation
+	__slots__ = tuple(_DEFAULTS) + (
+		"materials", "swaps", "servoMaps", "feedStates",
+		"_respQueue", "_rxBuffer", "_txQueue", "_stopEvent", "_connStop", "_lastResponse",
+		"_log", "_isKlipper", "_statusCB", "_responseCB", "_printer", "_reactor", "gcode",
+		"_keywordHandlers", "_responseHandlers", "_actionHandlers", "_stateHandlers", "_jsonParsers", "_tcHandlers", "_statusConfig", "_activeTool", "_spl"
+	)
+
 	def __init__(self, logger, isKlipper, statusCallback, responseCallback, config = None):
 		self._log 		= logger
 		self._isKlipper = isKlipper
@@ -230,112 +409,117 @@ class SmuffCore():
 				self._reactor 		= self._printer.get_reactor()
 				self.gcode 			= self._printer.lookup_object("gcode")
 
+		# handlers for responses consisting of a single keyword (see _parse_serial_data)
+		self._keywordHandlers = {
+			R_START:		self._handle_start,
+			R_OK:			self._handle_ok
+		}
+		# handlers for responses starting with a known prefix, grouped by the
+		# first character of the prefix (see _parse_serial_data)
+		self._responseHandlers = {}
+		for prefix, handler in (
+			(PERSTATE, 		self._handle_perstate),
+			(R_ECHO, 		self._handle_echo),
+			(R_ERROR, 		self._handle_error),
+			(ACTION_CMD, 	self._handle_action),
+			(R_JSONCAT, 	self._handle_jsoncat),
+			(R_JSON, 		self._handle_json),
+			(R_FWINFO, 		self._handle_fwinfo)
+		):
+			self._responseHandlers.setdefault(prefix[0], []).append((prefix, handler))
+
+		# handlers for the action commands (see _handle_action), tool changes are handled apart
+		self._actionHandlers = {
+			ACTION_WAIT:		self._action_wait,
+			ACTION_CONTINUE:	self._action_continue,
+			ACTION_ABORT:		self._action_abort,
+			ACTION_PONG:		self._action_pong
+		}
+
+		# tool change states (see _klipper_tool_change), state 0 means no tool change running
+		self._tcHandlers = (
+			None,
+			self._tc_pre_script,
+			self._tc_send,
+			self._tc_wait,
+			self._tc_feedstate,
+			self._tc_post_script,
+			self._tc_done
+		)
+
+		# parsers for the JSON configurations sent by the SMuFF (see _parse_json)
+		self._jsonParsers = {
+			C_BASIC:		self._json_basic,
+			C_MATERIALS:	self._json_materials,
+			C_SWAPS:		self._json_swaps,
+			C_SERVOMAPS:	self._json_servomaps,
+			C_FEEDSTATE:	self._json_feedstate
+		}
+
+		# handlers for the periodical states which aren't simple on/off flags (see _parse_states)
+		self._stateHandlers = {
+			"T:":		self._state_tool,
+			"TMC:":		self._state_tmc,
+			"SPL:":		self._state_spl,
+			"RLY:":		self._state_relay
+		}
+
 		self._reset()
 		self._log.debug("SMuFF-Core initialized")
 
 	def _reset(self):
 		self._log.info("Resetting core variables")
-		self.serialPort			= None      # serial port device name
-		self.baudrate			= 0         # serial port baudrate
-		self.timeout			= 0.0       # communication timeout
-		self.cmdTimeout			= 0.0       # command timeout
-		self.tcTimeout			= 0.0       # tool change timeout
-		self.wdTimeout			= 60.0 		# watchdog timeout
-		self.toolCount			= 0 		# number of tools on the SMuFF
-		self.autoConnect		= False		# flag, whether or not to connect at startup
-		self.dumpRawData 		= False		# for debugging only
-		self.fwInfo 			= "?"		# SMuFFs firmware info
-		self.curTool 			= "T-1"		# the current tool
-		self.preTool 			= "T-1"		# the previous tool
-		self.pendingTool 		= -1		# the tool on a pending tool change
-		self.selector 			= False		# status of the Selector endstop
-		self.revolver 			= False		# status of the Revolver endstop
-		self.feeder 			= False		# status of the Feeder endstop
-		self.feeder2			= False		# status of the 2nd Feeder endstop
-		self.isBusy				= False		# flag set when SMuFF signals "Busy"
-		self.isError			= False		# flag set when SMuFF signals "Error"
-		self.isProcessing		= False		# set when SMuFF is supposed to be busy
-		self.waitRequested		= False 	# set when SMuFF requested a "Wait" (in case of jams or similar)
-		self.abortRequested		= False		# set when SMuFF requested a "Abort"
-		self.isConnected		= False     # set after connection has been established
-		self.isAligned 			= False		# flag set when Feeder endstop is reached (not used yet)
-		self.isDDE 				= False		# flag whether the SMuFF is configured for DDE
-		self.hasSplitter 		= False		# flag whether the SMuFF is configured for the Splitter option
-		self.hasCutter 			= False		# flag whether the SMuFF is configured for the Cutter option
-		self.hasWiper 			= False		# flag whether the SMuFF is configured for the Wiper option
-		self.sdcard				= False     # set to True when SD-Card on SMuFF was removed
-		self.cfgChange			= False     # set to True when SMuFF configuration has changed
-		self.lid				= False     # set to True when Lid on SMuFF is open
-		self.isIdle				= False     # set to True when SMuFF is idle
-		self.usesTmc			= False     # set to True when SMuFF uses TMC drivers
-		self.tmcWarning			= False     # set to True when TMC drivers on SMuFF report warnings
-		self.device 			= "" 		# current name of the SMuFF
-		self.tcCount 			= 0			# number of tool changes in total (since reset)
-		self.durationTotal		= 0.0		# duration of all tool changes (for calculating average)
-		self.loadState			= 0			# load state of the current tool
-		self.fwVersion			= None		# firmware version on the SMuFF (i.e. "V3.10D")
-		self.fwBoard			= None		# board the SMuFF is running on (i.e. "SKR E3-DIP V1.1")
-		self.fwMode				= None		# firmware mode on the SMuFF (i.e. "SMUFF" or "PMMU2")
-		self.fwOptions			= None		# firmware options installed on the SMUFF (i.e "TMC|NEOPIXELS|DDE|...")
+		for name, value in self._DEFAULTS.items():
+			setattr(self, name, value)
+		# mutable values need fresh instances on each reset
 		self.materials	 		= []		# Two dimensional array of materials received from the SMuFF after SMUFF_MATERIALS
 		self.swaps	 			= []		# One dimensional array of tool swaps received from the SMuFF after SMUFF_SWAPS
 		self.servoMaps			= [] 		# One dimensional array of servo mappings received from the SMuFF after SMUFF_LIDMAPPINGS
-		self.feedStates			= [] 		# One dimensional array the feed state for each tool
-		self.relay 				= None 		# state of the relay E(xternal) or I(nternal)
-		self.isJammed 			= False 	# flag set when feeder is jammed
-		self.ignoreDebug		= True 		# ignore any debug messages coming from SMuFF
-
-		self._serial			= None      # serial instance
-		self._lastSerialEvent	= 0 		# last time (in millis) a serial receive took place
-		self._response			= None		# the response string from SMuFF
-		self._isReconnect 	    = False		# set when trying to re-establish serial connection
-		self._autoLoad          = True      # set to load new filament automatically after swapping tools
-		self._serEvent			= Event()	# event raised when a valid response has been received
-		self._serWdEvent		= Event()	# event raised when status data has been received
-		self._lastResponse     	= []		# last response SMuFF has sent (multiline)
-		self._stopSerial 		= False		# flag set when the serial reader / connector / watchdog need to be discarded
-		if self._serial:					# pySerial instance
-			self.close_serial()
-		self._sreader 			= None		# serial reader thread instance
-		self._sconnector		= None		# serial connector thread instance
-		self._swatchdog			= None		# serial watchdog thread instance
-		self._jsonCat 			= None		# category of the last JSON string received
-		self._stCount 			= 0 		# counter for states recevied
-		self._tcStartTime 		= 0			# time for tool change duration measurement
-		self._initStartTime		= 0			# time for _init_SMuFF timeout checking
-		self._okTimer 			= None		# (reactor) timer waiting for OK response
-		self._initTimer			= None		# (reactor) timer for _init_SMuFF
-		self._tcTimer 			= None		# (reactor) timer waiting for toolchange to finish
-		self._tcState			= 0			# tool change state
-		self._initState			= 0			# state for _init_SMuFF
-		self._lastCmdSent		= None		# GCode of the last command sent to SMuFF
-		self._lastCmdDone		= False		# flag if the last command sent has got a response
-		self._wdTimeoutDef 		= 60.0 		# default timeout for the serial port watchdog in seconds
+		self.feedStates			= []		# One dimensional array of the feed state for each tool
 
+		self._respQueue			= SimpleQueue()	# responses handed over from the serial reader to send_SMuFF_and_wait()
+		self._rxBuffer			= bytearray()	# received data not yet split into lines
+		self._txQueue			= SimpleQueue()	# encoded commands waiting for the serial writer
+		self._stopEvent			= Event()	# event set when the serial reader / watchdog need to be discarded
+		self._connStop			= Event()	# event raised to stop the connector thread
+		self._lastResponse     	= []		# last response SMuFF has sent (multiline)
+		self._refresh_status_config()
 
 	#
 	# Set status values to be used within Klipper (scripts, GCode)
 	#
 	def get_status(self, eventtime=None):
 		#self._log.info("get_status being called. M:{0} S:{1} ")
-		values = {
+		# Klipper compares the result with the previous one, hence always hand out a fresh dict
+		values = self._statusConfig.copy()
+		values["activetool"] 	= self.get_active_tool()
+		values["pendingtool"] 	= self.pendingTool
+		values["selector"] 		= self.selector
+		values["revolver"] 		= self.revolver
+		values["feeder"] 		= self.feeder
+		values["feeder2"] 		= self.feeder2
+		values["isbusy"] 		= self.isBusy
+		values["iserror"] 		= self.isError
+		values["isprocessing"] 	= self.isProcessing
+		values["isconnected"] 	= self.isConnected
+		values["isidle"] 		= self.isIdle
+		values["sdstate"] 		= self.sdcard
+		values["lidstate"] 		= self.lid
+		values["hascutter"] 	= self.hasCutter
+		values["haswiper"] 		= self.hasWiper
+		values["loadstate"] 	= self.loadState
+		values["relay"] 		= self.relay
+		values["jammed"] 		= self.isJammed
+		return values
+
+	#
+	# Rebuilds the part of the status which only changes when the SMuFF
+	# has sent its configuration or firmware info
+	#
+	def _refresh_status_config(self):
+		self._statusConfig = {
 			"tools":   		self.toolCount,
-			"activetool":   self.get_active_tool(),
-			"pendingtool":  self.pendingTool,
-			"selector":     self.selector,
-			"revolver":     self.revolver,
-			"feeder":       self.feeder,
-			"feeder2":      self.feeder2,
 			"fwinfo":       self.fwInfo,
-			"isbusy":       self.isBusy,
-			"iserror":      self.isError,
-			"isprocessing": self.isProcessing,
-			"isconnected":	self.isConnected,
-			"isidle": 		self.isIdle,
-			"sdstate": 		self.sdcard,
-			"lidstate": 	self.lid,
-			"hascutter":	self.hasCutter,
-			"haswiper":		self.hasWiper,
 			"materials": 	self.materials,
 			"swaps":		self.swaps,
 			"lidmappings":	self.servoMaps,
@@ -344,20 +528,17 @@ class SmuffCore():
 			"fwversion":	self.fwVersion,
 			"fwmode":		self.fwMode,
 			"fwoptions":	self.fwOptions,
-			"loadstate":	self.loadState,
 			"isdde":		self.isDDE,
-			"hassplitter":	self.hasSplitter,
-			"relay":		self.relay,
-			"jammed":		self.isJammed
+			"hassplitter":	self.hasSplitter
 		}
-		return values
 
 	def set_tool(self):
 		self.preTool = self.curTool
 		self.curTool = self.pendingTool
+		self._curToolNum = self.parse_tool_number(self.curTool)
 
 	def get_active_tool(self):
-		return self.parse_tool_number(self.curTool)
+		return self._curToolNum
 
 	def klipper_change_tool(self, gcmd = None):
 		if not self._tcTimer is None:
@@ -421,152 +602,171 @@ class SmuffCore():
 	def _klipper_tool_change(self, eventtime):
 
 		if self.dumpRawData:
-			self._log.info("Tool change state = {0}".format(self._tcState))
+			self._log.info("Tool change state = %s", self._tcState)
 
-		# state 1: run PRE_TOOLCHANGE macro
-		if self._tcState == 1:
-			self.start_tc_timer()
-			self.preTool = self.curTool
+		if 0 < self._tcState < len(self._tcHandlers):
+			return self._tcHandlers[self._tcState](eventtime)
 
-			if self._is_printing():
-				# run PRE_TOOLCHANGE gcode macro
-				self._log.info("Executing script {0}".format(G_PRE_TC.format(self.pendingTool)))
-				try:
-					self.gcode.run_script_from_command(G_PRE_TC.format(self.pendingTool))
-					self._tcState = 2
-				except self.gcode.error as err:
-					self._log.error("Script {0} has thrown an exception:\n\t{1}".format(PRE_TC, err))
-					self._tcState = 0
-			else:
-				self._tcState = 2
-			return eventtime + 0.1
+		# any other state: discard the timer
+		self._reactor.unregister_timer(self._tcTimer)
+		self._tcTimer = None
+		return eventtime
 
-		# state 2: send tool change command to SMuFF
-		elif self._tcState == 2:
-			self._lastCmdDone = False
-			# do the tool change on SMuFF
-			self._log.info("Changing tool from T{0} to T{1}".format(self.get_active_tool(), self.pendingTool))
-			self._lastCmdSent = TOOL + str(self.pendingTool)
-			self.send_SMuFF(self._lastCmdSent + (AUTOLOAD if self._autoLoad else ""))
-			self._tcState = 3
-			return eventtime + 5.0
-
-		# state 3: wait for response from SMuFF
-		elif self._tcState == 3:
-			if self._lastCmdDone:
-				if self.isError:
-					self._log.info("Tool change done, got ERROR response - skipping RESUME")
-					self._tcState = 6
-				else:
-					self._log.info("Tool change done, got OK response")
-					self._tcState = 4
-				return eventtime + 0.1
+	# state 1: run PRE_TOOLCHANGE macro
+	def _tc_pre_script(self, eventtime):
+		self.start_tc_timer()
+		self.preTool = self.curTool
+
+		if self._is_printing():
+			# run PRE_TOOLCHANGE gcode macro
+			self._log.info("Executing script %s", G_PRE_TC % self.pendingTool)
+			try:
+				self.gcode.run_script_from_command(G_PRE_TC % self.pendingTool)
+				self._tcState = 2
+			except self.gcode.error as err:
+				self._log.error("Script %s has thrown an exception:\n\t%s", PRE_TC, err)
+				self._tcState = 0
+		else:
+			self._tcState = 2
+		return eventtime + 0.1
+
+	# state 2: send tool change command to SMuFF
+	def _tc_send(self, eventtime):
+		self._lastCmdDone = False
+		# do the tool change on SMuFF
+		self._log.info("Changing tool from T%s to T%s", self.get_active_tool(), self.pendingTool)
+		self._lastCmdSent = tool_name(self.pendingTool)
+		self.send_SMuFF(self._lastCmdSent + (AUTOLOAD if self._autoLoad else ""))
+		self._tcState = 3
+		return eventtime + 5.0
+
+	# state 3: wait for response from SMuFF
+	def _tc_wait(self, eventtime):
+		if self._lastCmdDone:
+			if self.isError:
+				self._log.info("Tool change done, got ERROR response - skipping RESUME")
+				self._tcState = 6
 			else:
-				self._serWdEvent.set()
-				watchdog = (self._nowMS()-self._tcStartTime)/1000
-				# task already running longer than expected, interrupt it
-				# otherwise it'd run infinitly
-				if watchdog > self.tcTimeout:
-					self._log.error("Timed out while waiting for a response. Try increasing the tool change timeout (={0} sec.).".format(self.tcTimeout))
-					self._tcState = 6
-				return eventtime + 1.0
-
-		# state 4: query feed state from SMuFF
-		elif self._tcState == 4:
-			self._lastCmdSent = GETCONFIG.format(CFG_FEEDSTATE)
-			self.send_SMuFF(self._lastCmdSent)
-			self._tcState = 5
-			return eventtime + 0.2
-
-		# state 5: run POST_TOOLCHANGE macro
-		elif self._tcState == 5:
-			if self._is_print_paused():
-				prevTool = self.parse_tool_number(self.preTool)
-				# run POST_TOOLCHANGE gcode macro
-				self._log.info("Executing script {0}".format(G_POST_TC.format(prevTool, self._activeTool)))
-				try:
-					self.gcode.run_script_from_command(G_POST_TC.format(prevTool, self._activeTool))
-				except self.gcode.error as err:
-					self._log.error("Script {0} has thrown an exception:\n\t{1}".format(POST_TC, err))
-			self._tcState = 6
+				self._log.info("Tool change done, got OK response")
+				self._tcState = 4
 			return eventtime + 0.1
+		else:
+			self._wdLastAlive = time.monotonic()
+			watchdog = (now_ms()-self._tcStartTime)/1000
+			# task already running longer than expected, interrupt it
+			# otherwise it'd run infinitly
+			if watchdog > self.tcTimeout:
+				self._log.error("Timed out while waiting for a response. Try increasing the tool change timeout (=%s sec.).", self.tcTimeout)
+				self._tcState = 6
+			return eventtime + 1.0
+
+	# state 4: query feed state from SMuFF
+	def _tc_feedstate(self, eventtime):
+		self._lastCmdSent = GETCONFIG % CFG_FEEDSTATE
+		self.send_SMuFF(self._lastCmdSent)
+		self._tcState = 5
+		return eventtime + 0.2
+
+	# state 5: run POST_TOOLCHANGE macro
+	def _tc_post_script(self, eventtime):
+		if self._is_print_paused():
+			prevTool = self.parse_tool_number(self.preTool)
+			# run POST_TOOLCHANGE gcode macro
+			self._log.info("Executing script %s", G_POST_TC % (prevTool, self._activeTool))
+			try:
+				self.gcode.run_script_from_command(G_POST_TC % (prevTool, self._activeTool))
+			except self.gcode.error as err:
+				self._log.error("Script %s has thrown an exception:\n\t%s", POST_TC, err)
+		self._tcState = 6
+		return eventtime + 0.1
+
+	# state 6: calculate duration
+	def _tc_done(self, eventtime):
+		duration = self.stop_tc_timer()
+		self._log.info("Tool change took %s seconds. Average is %s seconds", duration, self.durationTotal / self.tcCount)
+		self._tcState = 0
+		return eventtime + 0.1
 
-		# state 6: calculate duration
-		elif self._tcState == 6:
-			duration = self.stop_tc_timer()
-			self._log.info("Tool change took {0} seconds. Average is {1} seconds".format(duration, self.durationTotal / self.tcCount))
-			self._tcState = 0
-			return eventtime + 0.1
+	#
+	# Sends a load / unload command and waits asynchronously for its OK response
+	#
+	# The timer gets registered on first use only and is re-armed for every
+	# further command, which makes it due at the latest after the tool change
+	# timeout. It's woken up right away by _wake_waiters() as soon as the
+	# OK/error response has arrived, so there's no need to poll in between.
+	#
+	def send_and_wait_for_ok(self, cmd):
+		self._lastCmdDone = False
+		self.send_SMuFF(cmd)
+		if self._okTimer is None:
+			self._okTimer = self._reactor.register_timer(self.wait_for_ok)
+		self._okArmed = True
+		self._reactor.update_timer(self._okTimer, self._reactor.monotonic() + self.tcTimeout)
 
-		# any other state: discard the timer
-		else:
-			self._reactor.unregister_timer(self._tcTimer)
-			self._tcTimer = None
-			return eventtime
+	#
+	# Returns True while a load / unload command is still waiting for its OK
+	#
+	def is_waiting_for_ok(self):
+		return self._okArmed
 
 	#
 	# Async load / unload handler
 	#
 	def wait_for_ok(self, eventtime):
+		if not self._okArmed:
+			return self._reactor.NEVER
 		if self._lastCmdDone:
 			if self.isError:
 				self._log.info("waiting done, got ERROR response")
 			else:
 				self._log.info("waiting done, got OK response")
-			self._reactor.unregister_timer(self._okTimer)
-			self._okTimer = None
-			return eventtime
 		else:
-			self._log.info("waiting for OK response...")
-			self._serWdEvent.set()
-			return eventtime + 2.0
+			self._log.info("no OK response within %s sec., stopped waiting", self.tcTimeout)
+		self._okArmed = False
+		return self._reactor.NEVER
+
+	#
+	# Wakes up the tool change / OK timers as soon as the last command
+	# has been answered, instead of having them wait for their next poll.
+	# Called from the serial reader thread, hence the async callback.
+	#
+	def _wake_waiters(self):
+		if self._isKlipper:
+			self._reactor.register_async_callback(self._wake_timers)
+
+	def _wake_timers(self, eventtime):
+		for timer in (self._tcTimer, self._okTimer):
+			if not timer is None:
+				self._reactor.update_timer(timer, self._reactor.NOW)
 
 	#
 	# Async basic init
 	#
 	def _async_init(self):
 		if self.dumpRawData:
-			self._log.info("_async_init: state {0} processing: {1}".format(self._initState, self.isProcessing))
-		if self._initState == 1:
-			# query some basic configuration settings
-			if self.isProcessing == False:
-				self.send_SMuFF(GETCONFIG.format(CFG_BASIC))
-		elif self._initState == 2:
-			# query materials configuration
-			if self.isProcessing == False:
-				self.send_SMuFF(GETCONFIG.format(CFG_MATERIALS))
-		elif self._initState == 3:
-			# request firmware info from SMuFF
-			if self.isProcessing == False:
-				if self.fwInfo == "?":
-					self.send_SMuFF(FWINFO)
-		elif self._initState == 4:
-			# query tool swap configuration settings
-			if self.isProcessing == False:
-				self.send_SMuFF(GETCONFIG.format(CFG_SWAPS))
-		elif self._initState == 5:
-			# query some lid servo mapping settings
-			if self.isProcessing == False:
-				self.send_SMuFF(GETCONFIG.format(CFG_SERVOMAPS))
-		elif self._initState == 6:
-			self._log.info("_async_init done")
-			self._initState = 0
+			self._log.info("_async_init: state %s processing: %s", self._initState, self.isProcessing)
+		if 0 < self._initState < len(INIT_QUERIES):
+			cmd = INIT_QUERIES[self._initState]
+			# the firmware info is only requested if it isn't known yet
+			if self.isProcessing == False and (cmd != FWINFO or self.fwInfo == "?"):
+				self.send_SMuFF(cmd)
 		else:
+			if self._initState == len(INIT_QUERIES):
+				self._log.info("_async_init done")
 			self._initState = 0
 
-
 	#
 	# Connects to the SMuFF via the configured serial interface (/dev/ttySMuFF by default)
 	#
-	def connect_SMuFF(self, gcmd=None):
+	def connect_SMuFF(self, gcmd=None, quiet=False):
 		self.isConnected = False
 		try:
-			self._open_serial()
+			self._open_serial(quiet)
 			if self._serial and self._serial.is_open:
 				self.isConnected = True
 				self._init_SMuFF() 	# query firmware info and current settings from the SMuFF
 				return True
-			else:
+			elif not quiet:
 				self._log.info("Opening serial {0} for SMuFF has failed".format(self.serialPort))
 		except Exception as err:
 			self._log.error("Connecting to SMuFF has thrown an exception:\n\t{0}".format(err))
@@ -574,14 +774,26 @@ class SmuffCore():
 
 	#
 	# Opens the serial port for the communication with the SMuFF
+	# If quiet is set (i.e. when called from the connector), a failure is neither
+	# reported to the console nor logged more than once per connector run.
 	#
-	def _open_serial(self):
+	def _open_serial(self, quiet=False):
+		global serial
+		if serial is None:
+			try:
+				import serial
+			except ImportError:
+				logging.critical("SMuFF: Python library 'pySerial' is missing. Please use 'pip install pyserial' first!")
+				return
 		try:
-			self._log.info("Opening serial port '{0}'".format(self.serialPort))
-			self._serial = serial.Serial(self.serialPort, self.baudrate, timeout=self.timeout, write_timeout=0)
+			if not quiet:
+				self._log.info("Opening serial port '{0}'".format(self.serialPort))
+			self._serial = serial.Serial(self.serialPort, self.baudrate, timeout=self.timeout, write_timeout=self.timeout)
 			if self._serial and self._serial.is_open:
 				self._log.info("Serial port opened")
-				self._stopSerial = False
+				self._stopEvent.clear()
+				del self._rxBuffer[:]
+				self._txQueue = SimpleQueue()
 				try:
 					# set up a separate task for reading the incoming SMuFF messages
 					self._sreader = Thread(target=self._serial_reader, name="TReader")
@@ -589,37 +801,46 @@ class SmuffCore():
 					self._sreader.start()
 					self._log.info("Serial reader thread running... ({0})".format(self._sreader))
 				except:
-					exc_type, exc_value, exc_traceback = sys.exc_info()
-					tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
-					self._log.error("Unable to start serial reader thread: ".join(tb))
+					self._log.exception("Unable to start serial reader thread")
+				try:
+					# set up a separate task for writing the outgoing commands
+					self._swriter = Thread(target=self._serial_writer, name="TWriter")
+					self._swriter.daemon = True
+					self._swriter.start()
+					self._log.info("Serial writer thread running... ({0})".format(self._swriter))
+				except:
+					self._log.exception("Unable to start serial writer thread")
 				self._start_watchdog()
-		except (OSError, serial.SerialException):
-			exc_type, exc_value, exc_traceback = sys.exc_info()
-			tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
-			err = "Can't open serial port '{0}'!\n\t{1}".format(self.serialPort, tb)
-			self._log.error(err)
+		except (OSError, serial.SerialException) as err:
+			if quiet:
+				if not self._connFailed:
+					self._connFailed = True
+					self._log.error("Can't open serial port '%s', retrying in the background:\n\t%s", self.serialPort, err)
+				return
+			self._log.exception("Can't open serial port '%s'!", self.serialPort)
 			if self._responseCB:
-				self._responseCB(err)
+				self._responseCB("Can't open serial port '{0}'!\n\t{1}".format(self.serialPort, err))
 
 
 	#
 	# Closes the serial port and cleans up resources
 	#
 	def close_serial(self):
+		self.stop_connector()
 		if not self._serial:
 			self._log.info("Serial wasn't initialized, nothing to do here")
 			return
-		self._stopSerial = True
+		self._stopEvent.set()		# stops the reader and wakes up the watchdog
 		# stop threads
+		if not self._isKlipper:
+			try:
+				if self._sconnector and self._sconnector.is_alive:
+					self._sconnector.join()
+				else:
+					self._log.error("Serial connector isn't alive")
+			except Exception as err:
+				self._log.error("Unable to shut down serial connector thread:\n\t{0}".format(err))
 		try:
-			if self._sconnector and self._sconnector.is_alive:
-				self._sconnector.join()
-			else:
-				self._log.error("Serial connector isn't alive")
-		except Exception as err:
-			self._log.error("Unable to shut down serial connector thread:\n\t{0}".format(err))
-		try:
-			self._serWdEvent.set()
 			if self._swatchdog and self._swatchdog.is_alive:
 				self._swatchdog.join()
 			else:
@@ -627,18 +848,32 @@ class SmuffCore():
 		except Exception as err:
 			self._log.error("Unable to shut down serial watchdog thread:\n\t{0}".format(err))
 		try:
+			try:
+				self._serial.cancel_read()	# wake up the reader waiting for data
+			except (AttributeError, OSError):
+				pass
 			if self._sreader and self._sreader.is_alive:
 				self._sreader.join()
 			else:
 				self._log.error("Serial reader isn't alive")
 		except Exception as err:
 			self._log.error("Unable to shut down serial reader thread:\n\t{0}".format(err))
+		try:
+			self._txQueue.put(None)		# wake up the writer so it can quit
+			if self._swriter and self._swriter.is_alive:
+				self._swriter.join()
+			else:
+				self._log.error("Serial writer isn't alive")
+		except Exception as err:
+			self._log.error("Unable to shut down serial writer thread:\n\t{0}".format(err))
 
-		# discard reader, connector and watchdog threads
+		# discard reader, writer, connector and watchdog threads
 		del(self._sreader)
+		del(self._swriter)
 		del(self._sconnector)
 		del(self._swatchdog)
 		self._sreader = None
+		self._swriter = None
 		self._sconnector = None
 		self._swatchdog = None
 		# close the serial port
@@ -651,75 +886,125 @@ class SmuffCore():
 			del(self._serial)
 			self._serial = None
 			self.isConnected = False
-		except (OSError, serial.SerialException):
-			exc_type, exc_value, exc_traceback = sys.exc_info()
-			tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
-			err = "Can't close serial port {0}!\n\t{1}".format(self.serialPort, tb)
-			self._log.error(err)
+		except (OSError, serial.SerialException) as err:
+			self._log.exception("Can't close serial port %s!", self.serialPort)
 			if self._responseCB:
-				self._responseCB(err)
+				self._responseCB("Can't close serial port {0}!\n\t{1}".format(self.serialPort, err))
 
 	#
 	# Serial reader thread
 	#
 	def _serial_reader(self):
 		self._log.info("Entering serial reader thread")
-		# this loop basically runs forever, unless _stopSerial is set or the
+		# this loop basically runs forever, unless _stopEvent is set or the
 		# serial port gets closed
-		while self._stopSerial == False:
+		while not self._stopEvent.is_set():
 			if self._serial and self._serial.is_open:
 				try:
-					time.sleep(0.1)
-					b = self._serial.in_waiting
-					if b > 0:
-						data = ""
-						try:
-							ln = self._serial.readline() 	# read to EOL
-							if ln:
-								data = ln.decode("ascii", errors='ignore')
-								if data: 					# don't parse empty strings
-									self._parse_serial_data(data)
-								else:
-									self._log.error("No valid data received: [{0}]".format(data))
-							else:
-								self._log.error("Empty line received: [{0}]".format(ln))
-						except UnicodeDecodeError as err:
-							self._log.error("Serial reader has thrown an exception:\n\t{0}\n\tData: [{1}]".format(err, data))
-							self._serial.reset_input_buffer()
-						except:
-							exc_type, exc_value, exc_traceback = sys.exc_info()
-							tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
-							self._log.error("Serial reader error: ".join(tb))
+					# block until at least one byte has arrived (or the port timeout
+					# has passed), fetch everything received so far with one single
+					# read and split it up into lines afterwards
+					data = self._serial.read(max(1, self._serial.in_waiting))
+					if data:
+						self._rxBuffer += data
+						self._process_rx_buffer()
 				except serial.SerialTimeoutException as err:
-					self._log.error("Serial reader has timed out:\n\t{0}".format(err))
-					self._serEvent.set()
+					self._log.error("Serial reader has timed out:\n\t%s", err)
+					self._post_response(None, True)
+					# pause before retrying, a failing port (i.e. unplugged USB)
+					# keeps raising right away
+					self._stopEvent.wait(0.1)
 				except serial.SerialException as err:
-					self._log.error("Serial reader has thrown an exception:\n\t{0}".format(err))
-					self._serEvent.set()
+					self._log.error("Serial reader has thrown an exception:\n\t%s", err)
+					self._post_response(None, True)
+					self._stopEvent.wait(0.1)
 			else:
 				if self._serial:
-					self._log.error("Serial port {0} has been closed".format(self._serial.port))
-				self._serEvent.set()
+					self._log.error("Serial port %s has been closed", self._serial.port)
+				self._post_response(None, True)
 				break
 
 		self._log.error("Shutting down serial reader")
 		if self._statusCB:
 			self._statusCB(active=False)
 
+	#
+	# Serial writer thread
+	# Sends the commands queued up by send_SMuFF(). Whatever has been queued
+	# in the meantime is coalesced into one single write, so neither Klipper
+	# nor the caller get blocked by a slow serial port.
+	#
+	def _serial_writer(self):
+		self._log.info("Entering serial writer thread")
+		running = True
+		while running:
+			data = self._txQueue.get()
+			if data is None:
+				break
+			buf = bytearray(data)
+			while True:
+				try:
+					data = self._txQueue.get_nowait()
+				except Empty:
+					break
+				if data is None:
+					running = False
+					break
+				buf += data
+			if self._serial and self._serial.is_open:
+				try:
+					n = self._serial.write(buf)
+					if self.dumpRawData:
+						self._log.info("Sent %s bytes: [%s]", n, bytes(buf))
+				except (OSError, serial.SerialException) as err:
+					self._log.error("Unable to send data to SMuFF:\n\t{0}".format(err))
+					# let send_SMuFF_and_wait() fail right away instead of running into its timeout
+					self._post_response(None, True)
+			else:
+				self._log.error("Serial port is closed, can't send data")
+				self._post_response(None, True)
+
+		self._log.info("Shutting down serial writer")
+
+	#
+	# Hands over all complete lines (terminated by '\n') from the receive buffer to the parser
+	#
+	def _process_rx_buffer(self):
+		eol = self._rxBuffer.rfind(b"\n")
+		if eol < 0:
+			return
+		self._lastSerialEvent = now_ms()	# once per batch, the lines arrived together anyway
+		# decode all complete lines at once, the incomplete rest stays in the buffer
+		data = self._rxBuffer[:eol].decode("ascii", errors='ignore')
+		del self._rxBuffer[:eol+1]
+		for line in data.split("\n"):
+			if not line: 					# don't parse empty strings
+				continue
+			try:
+				self._parse_serial_data(line)
+			except:
+				self._log.exception("Serial reader error")
+
 	#
 	# Method which starts _serial_connector() in the background.
+	# Within Klipper, the connector is a reactor timer instead of a thread.
+	# Since this gets called from the reconnect thread, the timer is
+	# registered through an async callback.
 	#
 	def start_connector(self):
+		if self._isKlipper:
+			self._reactor.register_async_callback(self._start_connector_timer)
+			return
 		try:
 			# set up a separate task for connecting to the SMuFF
+			self._connStop.clear()
+			self._connFailed = False
 			self._sconnector = Thread(target=self._serial_connector, name="TConnector")
 			self._sconnector.daemon=True
 			self._sconnector.start()
 			self._log.info("Serial connector thread running... ({0})".format(self._sconnector))
 		except:
-			exc_type, exc_value, exc_traceback = sys.exc_info()
-			tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
-			self._log.error("Unable to start serial connector thread: ".join(tb))
+			self._log.exception("Unable to start serial connector thread")
 
 	#
 	# Serial connector thread
@@ -727,20 +1012,52 @@ class SmuffCore():
 	#
 	def _serial_connector(self):
 		self._log.info("Entering serial connector thread")
-		time.sleep(3)
+		delay = CONN_RETRY_MIN
 
-		while 1:
-			if self.isConnected and self._stopSerial == True:
-				break
-			if self.connect_SMuFF == True:
+		# retry with increasing delays until connected or stopped by stop_connector()
+		while not self._connStop.wait(delay):
+			if self.isConnected or self.connect_SMuFF(quiet=True) == True:
 				break
-			time.sleep(3)
-			#self._log.info("Serial connector looping...")
+			delay = min(delay * 2, CONN_RETRY_MAX)
 
 		# as soon as the connection has been established, cancel the connector thread
 		self._log.info("Shutting down serial connector")
 		self._sconnector = None
 
+	def _start_connector_timer(self, eventtime):
+		if self._connTimer is None:
+			self._connDelay = CONN_RETRY_MIN
+			self._connFailed = False
+			self._connTimer = self._reactor.register_timer(self._try_connect_once, eventtime + self._connDelay)
+			self._log.info("Serial connector timer running...")
+
+	#
+	# Serial connector (reactor timer)
+	# Tries to connect with increasing delays until the connection has been established.
+	#
+	def _try_connect_once(self, eventtime):
+		if not self.isConnected and not self.connect_SMuFF(quiet=True):
+			self._connDelay = min(self._connDelay * 2, CONN_RETRY_MAX)
+			return eventtime + self._connDelay
+		# as soon as the connection has been established, cancel the connector timer
+		self._stop_connector_timer(eventtime)
+		return self._reactor.NEVER
+
+	def _stop_connector_timer(self, eventtime):
+		if not self._connTimer is None:
+			self._log.info("Shutting down serial connector")
+			self._reactor.unregister_timer(self._connTimer)
+			self._connTimer = None
+
+	#
+	# Stops the serial connector, in case it's still trying to connect
+	#
+	def stop_connector(self):
+		if self._isKlipper:
+			self._reactor.register_async_callback(self._stop_connector_timer)
+		else:
+			self._connStop.set()
+
 	#
 	# Method which starts the serial watchdog in the background.
 	#
@@ -752,24 +1069,25 @@ class SmuffCore():
 			self._swatchdog.start()
 			self._log.info("Serial watchdog thread running... ({0})".format(self._swatchdog))
 		except:
-			exc_type, exc_value, exc_traceback = sys.exc_info()
-			tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
-			self._log.error("Unable to start serial watchdog thread: ".join(tb))
+			self._log.exception("Unable to start serial watchdog thread")
 
 	#
 	# Serial watchdog thread
+	# Status updates only refresh the _wdLastAlive timestamp, the watchdog
+	# itself sleeps until that deadline has passed (or it's woken up for
+	# shutting down).
 	#
 	def _serial_watchdog(self):
 		self._log.info("Entering serial watchdog thread")
 
-		while self._stopSerial == False:
+		self._wdLastAlive = time.monotonic()
+		while not self._stopEvent.is_set():
 			if self._serial != None and self._serial.is_open == False:
 				break
-			self._serWdEvent.clear()
-			is_set = self._serWdEvent.wait(self.wdTimeout)
-			if self._stopSerial:
-				break
-			if is_set == False:
+			remaining = self._wdLastAlive + self.wdTimeout - time.monotonic()
+			if remaining > 0:
+				self._stopEvent.wait(remaining)
+			else:
 				self._log.info("Serial watchdog timed out... (no sign of life within {0} sec.)".format(self.wdTimeout))
 				reconnect = Thread(target=self.reconnect_SMuFF, name="TReconnect")
 				reconnect.daemon = True
@@ -782,7 +1100,7 @@ class SmuffCore():
 	# Tries to reconnect serial port to SMuFF
     #
 	def reconnect_SMuFF(self):
-		if self._sconnector:
+		if self._sconnector or self._connTimer:
 			self._log.info("Connector thread already running, aborting reconnect request...")
 			return
 		self.close_serial()
@@ -802,37 +1120,32 @@ class SmuffCore():
 	# Sends data to SMuFF
     #
 	def send_SMuFF(self, data):
-		self._set_busy(False)		# reset busy and
-		self._set_error(False)		# error flags
+		self.isBusy = False		# reset busy and
+		self.isError = False		# error flags
 
 		if self._lastCmdSent == None:
-			elements = data.split(" ", 1)
-			if len(elements):
-				self._lastCmdSent = elements[0]
-			else:
-				self._lastCmdSent = elements
+			self._lastCmdSent = data.partition(" ")[0]	# the GCode without its parameters
 
 		if self._lastCmdSent == RESET:
 			# don't log RESET
 			self._lastCmdSent = None
 
-		if self._serial and self._serial.is_open:
-			try:
-				b = bytearray(len(data)+2)
-				b = "{0}\n".format(data).encode("ascii")
-				n = self._serial.write(b)
-				if self.dumpRawData:
-					self._log.info("Sent {1} bytes: [{0}]".format(b, n))
-				return True
-			except (OSError, serial.SerialException) as err:
-				self._log.error("Unable to send command '{0}:\n\t' to SMuFF".format(data, err))
-				return False
+		ser = self._serial
+		if ser and ser.is_open:
+			# the actual write is done by the serial writer thread
+			b = ENCODED.get(data)
+			if b is None:
+				b = (data + "\n").encode("ascii")
+			self._txQueue.put(b)
+			return True
 		else:
 			self._log.error("Serial port is closed, can't send data")
 			return False
 
     #
 	# Sends data to SMuFF and will wait for a response (which in most cases is 'ok')
+	# Returns the response (None if there's none) along with the error flag that
+	# came with it, so callers don't have to rely on isError being unchanged
     #
 	def send_SMuFF_and_wait(self, data):
 
@@ -843,38 +1156,39 @@ class SmuffCore():
 			timeout = self.cmdTimeout	# wait max. 25 seconds for other operations
 			tmName = "command"
 		self.wdTimeout = timeout
-		done = False
 		result = None
+		isError = False
 
+		# discard responses left over from previous commands
+		while not self._respQueue.empty():
+			self._respQueue.get_nowait()
+		self._awaitResponse = True
 		if self.send_SMuFF(data) == False:
+			self._awaitResponse = False
 			self._log.error("Failed to send command to SMuFF, aborting 'send_SMuFF_and_wait'")
-			return None
-		self._set_processing(True)	# SMuFF is currently doing something
-
-		while not done:
-			self._serEvent.clear()
-			is_set = self._serEvent.wait(timeout)
-			if is_set == True:
-				self._log.info("To [{0}] SMuFF says [{1}]  {2}".format(data, self._response, "(Error reported)" if self.isError else "(Ok)"))
-				result = self._response
-				if self._response == None or self.isError:
-					done = True
-				elif not self._response.startswith(R_ECHO):
-					done = True
-
-				self._response = None
-			else:
+			return None, True
+		self.isProcessing = True	# SMuFF is currently doing something
+
+		# the reader hands over the final response only (echo lines are handled
+		# by the reader itself), hence a single get() will do; only keep
+		# on waiting if the SMuFF has reported being busy
+		while True:
+			try:
+				result, isError = self._respQueue.get(timeout=timeout)
+				self._log.info("To [{0}] SMuFF says [{1}]  {2}".format(data, result, "(Error reported)" if isError else "(Ok)"))
+				break
+			except Empty:
 				resp = "*** Timed out *** while waiting for a response on cmd '{0}'. Try increasing the {1} timeout (={2} sec.).".format(data, tmName, timeout)
 				if self._responseCB:
 					self._responseCB(resp)
 				self._log.info(resp)
 				if self.isBusy == False:
-					done = True
-					self._set_processing(False)
+					break
 
-		self._set_processing(False)	# SMuFF is not supposed to do anything
+		self._awaitResponse = False
+		self.isProcessing = False	# SMuFF is not supposed to do anything
 		self.wdTimeout = self._wdTimeoutDef
-		return result
+		return result, isError
 
 	#
 	# Initializes data of this module by requesting runtime setting from the SMuFF
@@ -884,36 +1198,26 @@ class SmuffCore():
 		# turn on sending of periodical states
 		self.send_SMuFF(PERSTATE + OPT_ON)
 
-	#
-	# set/reset processing flag
-	#
-	def _set_processing(self, processing):
-		self.isProcessing = processing
-
-	#
-	# set/reset busy flag
-	#
-	def _set_busy(self, busy):
-		self.isBusy = busy
-
-	#
-	# set/reset error flag
-	#
-	def _set_error(self, error):
-		self.isError = error
-
 	#
 	# set last response received (i.e. everything below the GCode and above the "ok\n")
 	#
 	def _set_response(self, response):
 		if not response == None:
-			if response.rstrip("\n") == RESET:
-				self._response = ""
+			if response == RESET:
+				self._post_response("", self.isError)
 			else:
-				self._response = response.rstrip("\n")
+				self._post_response(response, self.isError)
 		else:
-			self._response = ""
-		self._lastResponse = []
+			self._post_response("", self.isError)
+		self._lastResponse.clear()
+
+	#
+	# Hands over a response (or None if there's none) to a pending send_SMuFF_and_wait(),
+	# along with the error flag, so the waiter doesn't depend on isError being unchanged
+	#
+	def _post_response(self, response, isError=False):
+		if self._awaitResponse:
+			self._respQueue.put((response, isError))
 
 	#
 	# Dump string s as a hex string (for debugging only)
@@ -922,6 +1226,46 @@ class SmuffCore():
 		self._log.info(":".join("{:02x}".format(ord(c)) for c in s))
 
 
+	#
+	# Parsers for the JSON configurations, by category (see _parse_json)
+	#
+	def _json_basic(self, cfg):
+		self.device 		= cfg["Device"]
+		self.toolCount 		= cfg["Tools"]
+		self._toolKeys 		= tuple(tool_name(i) for i in range(self.toolCount))
+		self.hasCutter		= cfg["UseCutter"]
+		self.hasSplitter 	= cfg["UseSplitter"]
+		self.isDDE 			= cfg["UseDDE"]
+		self._initState += 1
+
+	def _json_materials(self, cfg):
+		try:
+			tools = [cfg[t] for t in self._toolKeys]
+			self.materials = [(tool["Material"], tool["Color"], tool["PFactor"]) for tool in tools]
+			self._initState += 1
+		except Exception as err:
+			self._log.error("Parsing materials has thrown an exception:\n\t%s", err)
+
+	def _json_swaps(self, cfg):
+		try:
+			self.swaps = [cfg[t] for t in self._toolKeys]
+			self._initState += 1
+		except Exception as err:
+			self._log.error("Parsing tool swaps has thrown an exception:\n\t%s", err)
+
+	def _json_servomaps(self, cfg):
+		try:
+			self.servoMaps = [cfg[t]["Close"] for t in self._toolKeys]
+			self._initState += 1
+		except Exception as err:
+			self._log.error("Parsing lid mappings has thrown an exception:\n\t%s", err)
+
+	def _json_feedstate(self, cfg):
+		try:
+			self.feedStates = [cfg[t] for t in self._toolKeys]
+		except Exception as err:
+			self._log.error("Parsing feed states has thrown an exception:\n\t%s", err)
+
 	#
 	# Parses a JSON response sent by the SMuFF (used for retrieving SMuFF settings)
 	#
@@ -929,94 +1273,23 @@ class SmuffCore():
 		if category == None or data == None:
 			return
 		if self.dumpRawData:
-			self._log.info("Parse JSON (category '{1}'):\n\t[{0}]".format(data, category))
+			self._log.info("Parse JSON (category '%s'):\n\t[%s]", category, data)
 
 		if data:
-			resp = ""
 			try:
-				cfg = json.loads(data)
+				cfg = _json_loads(data)
 				if cfg == None:
 					return
-				# basic configuration
-				if category == C_BASIC:
-					self.device 		= cfg["Device"]
-					self.toolCount 		= cfg["Tools"]
-					self.hasCutter		= cfg["UseCutter"]
-					self.hasSplitter 	= cfg["UseSplitter"]
-					self.isDDE 			= cfg["UseDDE"]
-					self._initState += 1
-
-				# stepper configuration
-				if category == C_STEPPERS:
-					pass
-
-				# TMC driver configuration
-				if category == C_TMC:
-					pass
-
-				# materials configuration
-				if category == C_MATERIALS:
-					try:
-						self.materials = []
-						for i in range(self.toolCount):
-							t = "T"+str(i)
-							material = [ cfg[t]["Material"], cfg[t]["Color"], cfg[t]["PFactor"] ]
-							self.materials.append(material)
-							#resp += "Tool {0} is '{2} {1}' with a purge factor of {3}%\n".format(i, material[0], material[1], material[2])
-						self._initState += 1
-					except Exception as err:
-						self._log.error("Parsing materials has thrown an exception:\n\t{0}".format(err))
-
-				# tool swapping configuration
-				if category == C_SWAPS:
-					try:
-						self.swaps = []
-						for i in range(self.toolCount):
-							t = "T"+str(i)
-							swap = cfg[t]
-							self.swaps.append(swap)
-							#resp += "Tool {0} is assigned to tray {1}\n".format(i, swap)
-						self._initState += 1
-					except Exception as err:
-						self._log.error("Parsing tool swaps has thrown an exception:\n\t{0}".format(err))
-
-				# servo mapping configuration
-				if category == C_SERVOMAPS:
-					try:
-						self.servoMaps = []
-						for i in range(self.toolCount):
-							t = "T"+str(i)
-							servoMap = cfg[t]["Close"]
-							self.servoMaps.append(servoMap)
-							#resp += "Tool {0} closed @ {1} deg.\n".format(i, servoMap)
-						self._initState += 1
-					except Exception as err:
-						self._log.error("Parsing lid mappings has thrown an exception:\n\t{0}".format(err))
-
-				# feeder states
-				if category == C_FEEDSTATE:
-					try:
-						self.feedStates = []
-						for i in range(self.toolCount):
-							t = "T"+str(i)
-							feedState = cfg[t]
-							self.feedStates.append(feedState)
-							#resp += "Tool load state {0}\n".format(i, feedState)
-					except Exception as err:
-						self._log.error("Parsing feed states has thrown an exception:\n\t{0}".format(err))
-
-				if len(resp) and self._isKlipper:
-					try:
-						self.gcode.respond_info(resp)
-					except Exception as err:
-						self._log.error("Sending response to Klipper has thrown an exception:\n\t{0}".format(err))
-				else:
-					if self._responseCB:
-						self._responseCB(resp)
+				# hand the configuration over to the parser for its category
+				# (steppers and TMC driver configurations aren't used yet)
+				parser = self._jsonParsers.get(category)
+				if parser:
+					parser(cfg)
 
+				self._refresh_status_config()
 
 			except Exception as err:
-				self._log.error("Parse JSON for category {1} has thrown an exception:\n\t{0}\n\t[{1}]".format(err, self._jsonCat, data))
+				self._log.error("Parse JSON for category %s has thrown an exception:\n\t%s\n\t[%s]", category, err, data)
 
 	#
 	# Parses the states periodically sent by the SMuFF
@@ -1028,59 +1301,62 @@ class SmuffCore():
 
 		# Note: SMuFF sends periodically states in this notation:
 		# 	"echo: states: T: T4  S: off  R: off  F: off  F2: off  TMC: -off  SD: off  SC: off  LID: off  I: off  SPL: 0"
-		for m in re.findall(r'([A-Z]{1,3}[\d|:]+).(\+?\w+|-?\d+|\-\w+)+',states):
-			if   m[0] == "T:":                          # current tool
-				self.curTool      	= m[1].strip()
-			elif m[0] == "S:":                          # Selector endstop state
-				self.selector      = m[1].strip() == T_ON.lower()
-			elif m[0] == "R:":                          # Revolver endstop state
-				self.revolver      = m[1].strip() == T_ON.lower()
-			elif m[0] == "F:":                          # Feeder endstop state
-				self.feeder        = m[1].strip() == T_ON.lower()
-			elif m[0] == "F2:":                         # DDE-Feeder endstop state
-				self.feeder2       = m[1].strip() == T_ON.lower()
-			elif m[0] == "SD:":                         # SD-Card state
-				self.sdcard        = m[1].strip() == T_ON.lower()
-			elif m[0] == "SC:":                         # Settings Changed
-				self.cfgChange     = m[1].strip() == T_ON.lower()
-			elif m[0] == "LID:":                        # Lid state
-				self.lid           = m[1].strip() == T_ON.lower()
-			elif m[0] == "I:":                          # Idle state
-				self.isIdle        = m[1].strip() == T_ON.lower()
-			elif m[0] == "TMC:":                        # TMC option
-				v = m[1].strip()
-				self.usesTmc = v.startswith("+")
-				self.tmcWarning = v[1:] == T_ON.lower()
-			elif m[0] == "SPL:":                        # Splitter/Feeder load state
-				self._spl = int(m[1].strip())
-				if self.curTool == "-1":
-					self.loadState = -1					# no tool selected
-				else:
-					if self._spl == 0:
-						self.loadState = 0					# not loaded
-					if self._spl == 0x01 or self._spl == 0x10:
-						self.loadState = 1					# loaded to Selector or Splitter
-					if self._spl == 0x02 or self._spl == 0x20:
-						self.loadState = 2					# loaded to Nozzle
-					if self._spl == 0x40:
-						self.loadState = 3					# loaded to DDE
-			elif m[0] == "RLY:":                        # Relay state (E/I)
-				self.relay = m[1].strip()
-			elif m[0] == "JAM:":                        # Feeder jammed flag
-				self.isJammed = m[1].strip() == T_ON.lower()
-
-			#else:
-				#	self._log.error("Unknown state: [" + m[0] + "]")
+		# hence after the "echo: states:" header, each key (ending with ':') is followed
+		# by its value; a key without a value or any extra words are skipped, so a
+		# malformed state can't shift the keys and values following it
+		key = None
+		for value in states.split()[2:]:
+			if value[-1] == ":":
+				key = value
+				continue
+			if key is None:
+				continue
+			attr = STATE_FLAGS.get(key)
+			if attr:									# simple on/off states
+				setattr(self, attr, value == T_ON_LC)
+			else:
+				handler = self._stateHandlers.get(key)
+				if handler:
+					handler(value)
+				#else:
+				#	self._log.error("Unknown state: [" + key + "]")
+			key = None
 
 		if self._statusCB:
 			self._statusCB(active=True)
 
-		self._serWdEvent.set()
+		self._wdLastAlive = time.monotonic()
 		self._stCount += 1
 		if self._initState > 0:
 			self._async_init()
 		return True
 
+	def _state_tool(self, value):					# current tool
+		if value != self.curTool:					# parse the number on changes only
+			self.curTool = sys.intern(value)
+			self._curToolNum = self.parse_tool_number(self.curTool)
+
+	def _state_tmc(self, value):					# TMC option
+		self.usesTmc = value[:1] == "+"
+		self.tmcWarning = value[1:] == T_ON_LC
+
+	def _state_spl(self, value):					# Splitter/Feeder load state
+		self._spl = int(value)
+		if self.curTool == "-1":
+			self.loadState = -1					# no tool selected
+		else:
+			if self._spl == 0:
+				self.loadState = 0					# not loaded
+			if self._spl == 0x01 or self._spl == 0x10:
+				self.loadState = 1					# loaded to Selector or Splitter
+			if self._spl == 0x02 or self._spl == 0x20:
+				self.loadState = 2					# loaded to Nozzle
+			if self._spl == 0x40:
+				self.loadState = 3					# loaded to DDE
+
+	def _state_relay(self, value):					# Relay state (E/I)
+		self.relay = value
+
 	#
 	# Converts the string 'Tn' into a tool number
 	#
@@ -1089,231 +1365,241 @@ class SmuffCore():
 			return -1
 		try:
 			#self._log.info("Tool: [{}]".format(tool))
-			return int(re.findall(r'[-\d]+', tool)[0])
+			return parse_tool(tool)
 		except Exception as err:
-			self._log.error("Can't parse tool number in {0}:\n\t{1}".format(tool, err))
+			self._log.error("Can't parse tool number in %s:\n\t%s", tool, err)
 		return -1
 
 	#
 	# Parses the response we've got from the SMuFF
 	#
 	def _parse_serial_data(self, data):
-		if data == None or len(data) == 0 or data == "\n":
+		if not data or data.isspace():	# nothing to do for empty lines
 			return
+		data = data.rstrip("\n")		# strip the line end once, handlers get the bare line
 
 		if self.dumpRawData:
-			self._log.info("Raw data: [{0}]".format(data.rstrip("\n")))
+			self._log.info("Raw data: [%s]", data)
 
-		self._lastSerialEvent = self._nowMS()
-		self._serEvent.clear()
-
-		# after first connect the response from the SMuFF is supposed to be 'start'
-		if data.startswith(R_START):
-			self._log.info("\"start\" response received")
-			self._serEvent.set()
-			self._init_SMuFF()
+		# single keyword lines ("start", "ok") and lines starting with a known
+		# prefix get handed over to the according handler
+		handler = self._keywordHandlers.get(data)
+		if handler:
+			handler(data)
 			return
+		for prefix, handler in self._responseHandlers.get(data[0], ()):
+			if data.startswith(prefix):
+				handler(data)
+				return
 
-		if data.startswith(PERSTATE):
-			if self.dumpRawData:
-				self._log.info("Periodical states sending is ON")
-			self._initState = 1
-			return
+		# store all responses before the "ok"
+		self._lastResponse.append(data)
+		self._log.debug("Last response received: [%s]", data)
 
-		if data.startswith(R_ECHO):
-			# don't process any general debug messages
-			index = len(R_ECHO)+1
-			if data[index:].startswith(R_DEBUG):
-				err = "SMuFF has sent a debug response: [{0}]".format(data.rstrip())
-				self._log.debug(err)
-				if not self.ignoreDebug:
-					# filter out ESC sequences
-					match = re.sub(r'\033\[\d+m', '', err)
-					if match != None:
-						err = match
-					if self._isKlipper:
-						self.gcode.respond_info(err)
-					else:
-						if self._responseCB:
-							self._responseCB(err)
-			# but do process the tool/endstop states
-			elif data[index:].startswith(R_STATES):
-				self._parse_states(data.rstrip())
-			# and register whether SMuFF is busy
-			elif data[index:].startswith(R_BUSY):
-				err = "SMuFF has sent a busy response: [{0}]".format(data.rstrip())
-				self._log.debug(err)
+	#
+	# Response handlers called from _parse_serial_data
+	#
+	def _handle_start(self, data):
+		# after first connect the response from the SMuFF is supposed to be 'start'
+		self._log.info("\"start\" response received")
+		self._post_response(None)
+		self._init_SMuFF()
+
+	def _handle_perstate(self, data):
+		if self.dumpRawData:
+			self._log.info("Periodical states sending is ON")
+		self._initState = 1
+
+	def _handle_echo(self, data):
+		body = data[ECHO_LEN:]
+		# process the tool/endstop states (by far the most frequent echo)
+		if body.startswith(R_STATES):
+			self._parse_states(data)
+		# don't process any general debug messages
+		elif body.startswith(R_DEBUG):
+			err = "SMuFF has sent a debug response: [{0}]".format(data)
+			self._log.debug(err)
+			if not self.ignoreDebug:
+				# filter out ESC sequences
+				match = RE_ESC.sub('', err)
+				if match != None:
+					err = match
 				if self._isKlipper:
 					self.gcode.respond_info(err)
 				else:
 					if self._responseCB:
 						self._responseCB(err)
-				self._set_busy(True)
-			return
-
-		if data.startswith(R_ERROR):
-			err = "SMuFF has sent an error response: [{0}]".format(data.rstrip())
-			self._log.info(err)
+		# and register whether SMuFF is busy
+		elif body.startswith(R_BUSY):
+			err = "SMuFF has sent a busy response: [{0}]".format(data)
+			self._log.debug(err)
 			if self._isKlipper:
 				self.gcode.respond_info(err)
 			else:
 				if self._responseCB:
 					self._responseCB(err)
-			index = len(R_ERROR)+1
-			# maybe the SMuFF has received garbage
-			if data[index:].startswith(R_UNKNOWNCMD) and self._serial != None:
-				self._serial.reset_output_buffer()
-				self._serial.reset_input_buffer()
-			self._set_error(True)
-			if self._lastCmdSent != None:
-				self._lastCmdSent = None
-				self._lastCmdDone = True
-			return
-
-		if data.startswith(ACTION_CMD):
-			self._log.debug("SMuFF has sent an action request: [{0}]".format(data.rstrip()))
-			index = len(ACTION_CMD)
-			# what action is it? is it a tool change?
-			if data[index:].startswith(TOOL):
-				tool = self.parse_tool_number(data[10:])
-				# only if the printer isn't printing
-				if self._is_printing() == False:
-					# query the heater
-					heater = self._printer.lookup_object("heater")
-					try:
-						if heater.extruder.can_extrude:
-							self._log.debug("Extruder is up to temp.")
-							self._printer.change_tool("tool{0}".format(tool))
-							self.send_SMuFF("{0} T: OK".format(ACTION_CMD))
-						else:
-							self._log.error("Can't change to tool {0}, nozzle not up to temperature".format(tool))
-							self.send_SMuFF("{0} T: \"Nozzle too cold\"".format(ACTION_CMD))
-					except:
-						self._log.error("Can't query temperatures. Aborting.")
-						self.send_SMuFF("{0} T: \"No nozzle temp. avail.\"".format(ACTION_CMD))
-				else:
-					self._log.error("Can't change to tool {0}, printer not ready or printing".format(tool))
-					self.send_SMuFF("{0} T: \"Printer not ready\"".format(ACTION_CMD))
-
-			if data[index:].startswith(ACTION_WAIT):
-				self.waitRequested = True
-				self._log.info("Waiting for SMuFF to come clear... (ACTION_WAIT)")
+			self.isBusy = True
 
-			if data[index:].startswith(ACTION_CONTINUE):
-				self.waitRequested = False
-				self.abortRequested = False
-				self._log.info("Continuing after SMuFF cleared... (ACTION_CONTINUE)")
-
-			if data[index:].startswith(ACTION_ABORT):
-				self.waitRequested = False
-				self.abortRequested = True
-				self._log.info("SMuFF is aborting action operation... (ACTION_ABORT)")
-
-			if data[index:].startswith(ACTION_PONG):
-				self._log.info("PONG received from SMuFF (ACTION_PONG)")
-			return
-
-		if data.startswith(R_JSONCAT):
-			self._jsonCat = data[2:].rstrip("*/\n").strip(" ").lower()
-			return
-
-		if data.startswith(R_JSON):
-			self._parse_json(data, self._jsonCat)
-			self._jsonCat = None
-			return
-
-		if data.startswith(R_FWINFO):
-			self.fwInfo = data.rstrip("\n")
-			if self._isKlipper:
-				self.gcode.respond_info(T_FW_INFO.format(self.fwInfo))
+	def _handle_error(self, data):
+		err = "SMuFF has sent an error response: [{0}]".format(data)
+		self._log.info(err)
+		if self._isKlipper:
+			self.gcode.respond_info(err)
+		else:
 			if self._responseCB:
-				self._responseCB(T_FW_INFO.format(self.fwInfo))
+				self._responseCB(err)
+		# maybe the SMuFF has received garbage
+		if data[ERROR_LEN:].startswith(R_UNKNOWNCMD) and self._serial != None:
+			self._serial.reset_output_buffer()
+			self._serial.reset_input_buffer()
+		self.isError = True
+		if self._lastCmdSent != None:
 			self._lastCmdSent = None
+			self._lastCmdDone = True
+			self._wake_waiters()
+
+	def _handle_action(self, data):
+		self._log.debug("SMuFF has sent an action request: [%s]", data)
+		action = data[ACTION_LEN:]
+		handler = self._actionHandlers.get(action.partition(" ")[0])
+		if handler:
+			handler(data)
+		# what action is it? is it a tool change?
+		elif action.startswith(TOOL):
+			self._action_tool(data)
+
+	def _action_tool(self, data):
+		tool = self.parse_tool_number(data[10:])
+		# only if the printer isn't printing
+		if self._is_printing() == False:
+			# query the heater
+			if self._heater is None:
+				self._heater = self._printer.lookup_object("heater")
 			try:
-				arr = re.findall(r"FIRMWARE_NAME\:\s(.*)\sFIRMWARE_VERSION\:\s(.*)\sELECTRONICS\:\s(.*)\sDATE\:\s(.*)\sMODE\:\s(.*)\sOPTIONS\:\s(.*)", self.fwInfo)
-				if len(arr):
-					self.fwVersion 	= arr[0][1]
-					self.fwBoard 	= arr[0][2]
-					self.fwMode 	= arr[0][4]
-					self.fwOptions 	= arr[0][5]
-			except Exception as err:
-				self._log.error("Can't regex firmware info:\n\t{0}".format(err))
-			self._initState += 1
-			return
-
-		if data.startswith(R_OK):
-			if self.isError:
-				self._set_response(None)
-				self._lastCmdSent = None
-				self._lastCmdDone = True
-			else:
-				if self.dumpRawData:
-					self._log.info("[OK->] LastCommand '{0}'   LastResponse {1}".format(self._lastCmdSent, pformat(self._lastResponse)))
+				if self._heater.extruder.can_extrude:
+					self._log.debug("Extruder is up to temp.")
+					self._printer.change_tool("tool{0}".format(tool))
+					self.send_SMuFF("{0} T: OK".format(ACTION_CMD))
+				else:
+					self._log.error("Can't change to tool %s, nozzle not up to temperature", tool)
+					self.send_SMuFF("{0} T: \"Nozzle too cold\"".format(ACTION_CMD))
+			except:
+				self._log.error("Can't query temperatures. Aborting.")
+				self.send_SMuFF("{0} T: \"No nozzle temp. avail.\"".format(ACTION_CMD))
+		else:
+			self._log.error("Can't change to tool %s, printer not ready or printing", tool)
+			self.send_SMuFF("{0} T: \"Printer not ready\"".format(ACTION_CMD))
+
+	def _action_wait(self, data):
+		self.waitRequested = True
+		self._log.info("Waiting for SMuFF to come clear... (ACTION_WAIT)")
+
+	def _action_continue(self, data):
+		self.waitRequested = False
+		self.abortRequested = False
+		self._log.info("Continuing after SMuFF cleared... (ACTION_CONTINUE)")
+
+	def _action_abort(self, data):
+		self.waitRequested = False
+		self.abortRequested = True
+		self._log.info("SMuFF is aborting action operation... (ACTION_ABORT)")
+
+	def _action_pong(self, data):
+		self._log.info("PONG received from SMuFF (ACTION_PONG)")
+
+	def _handle_jsoncat(self, data):
+		self._jsonCat = sys.intern(data[2:].strip(" */").lower())	# interned, as it's used as a lookup key
+
+	def _handle_json(self, data):
+		self._parse_json(data, self._jsonCat)
+		self._jsonCat = None
+
+	def _handle_fwinfo(self, data):
+		self.fwInfo = data
+		if self._isKlipper:
+			self.gcode.respond_info(T_FW_INFO.format(self.fwInfo))
+		if self._responseCB:
+			self._responseCB(T_FW_INFO.format(self.fwInfo))
+		self._lastCmdSent = None
+		# walk through the words of the info; each value runs up to the next known field name
+		values = {}
+		field = None
+		for word in self.fwInfo.split():
+			if word in R_FWINFO_FIELDS:
+				field = R_FWINFO_FIELDS[word]
+				if field:
+					values[field] = []
+			elif field:
+				values[field].append(word)
+		for field, words in values.items():
+			setattr(self, field, " ".join(words))
+		self._refresh_status_config()
+		self._initState += 1
+
+	def _handle_ok(self, data):
+		wasDone = self._lastCmdDone
+		if self.isError:
+			self._set_response(None)
+			self._lastCmdSent = None
+			self._lastCmdDone = True
+		else:
+			lastResponse = self._lastResponse
+			lastCmdSent = self._lastCmdSent
+			if self.dumpRawData:
+				self._log.info("[OK->] LastCommand '%s'   LastResponse %s", lastCmdSent, json.dumps(lastResponse, separators=(",", ":"), default=str))
 
-				firstResponse = self._lastResponse[0].rstrip("\n") if len(self._lastResponse) else None
+			firstResponse = lastResponse[0] if lastResponse else None
 
-				if firstResponse == RESET:
-					firstResponse = None
-					self._lastCmdDone = True
+			if firstResponse == RESET:
+				firstResponse = None
+				self._lastCmdDone = True
 
-				if self._lastCmdSent == ANY:
+			if lastCmdSent == ANY:
+				self._lastCmdDone = True
+			elif firstResponse != None:
+				if firstResponse == lastCmdSent:
 					self._lastCmdDone = True
-				elif firstResponse != None:
-					if firstResponse == self._lastCmdSent:
-						self._lastCmdDone = True
 
-				if self.dumpRawData and self._lastCmdSent:
-					self._log.info("lastCmdDone is {0}".format(self._lastCmdDone))
-				self._set_response("".join(self._lastResponse))
-			self._lastCmdSent = None
-			# set serEvent only after a ok was received
-			self._serEvent.set()
-			return
-
-		# store all responses before the "ok"
-		if data:
-			self._lastResponse.append(str(data))
-		self._log.debug("Last response received: [{0}]".format(self._lastResponse[len(self._lastResponse)-1]))
+			if self.dumpRawData and lastCmdSent:
+				self._log.info("lastCmdDone is %s", self._lastCmdDone)
+			self._set_response("\n".join(lastResponse))
+		self._lastCmdSent = None
+		if self._lastCmdDone and not wasDone:
+			self._wake_waiters()
 
 	#
 	# Klipper helper functions
 	#
 	def _is_printing(self):
 		if self._isKlipper and self._printer:
-			idle_timeout = self._printer.lookup_object("idle_timeout")
-			return idle_timeout.state == ST_PRINTING
+			if self._idleTimeout is None:
+				self._idleTimeout = self._printer.lookup_object("idle_timeout")
+			return self._idleTimeout.state == ST_PRINTING
 		return False
 
 	def _is_print_paused(self):
 		if self._isKlipper and self._printer:
-			state = self._printer.lookup_object("pause_resume")
-			return state.is_paused
+			if self._pauseResume is None:
+				self._pauseResume = self._printer.lookup_object("pause_resume")
+			return self._pauseResume.is_paused
 		return False
 
-	#
-	# Helper function to retrieve time in milliseconds
-	#
-	def _nowMS(self):
-		return int(round(time.time() * 1000, None))
-
 	def get_states(self, gcmd=None):
-		connStat = T_STATE_INFO_NC.format(
+		connStat = T_STATE_INFO_NC % (
 			T_YES if self.isConnected else T_NO,
 			self.serialPort)
 
 		if self.isConnected:
 			durationAvg =  (self.durationTotal / self.tcCount) if self.durationTotal > 0 and self.tcCount > 0 else 0
-			loadState = {
-				-1: T_NO_TOOL,
-				0: T_NO,
-				1: T_TO_SPLITTER if self.hasSplitter else T_TO_SELECTOR,
-				2: T_YES,
-				3: T_TO_DDE
-			}
-			loaded = loadState.get(self.loadState, T_INVALID_STATE)
+			if self.loadState == 1:
+				loaded = T_TO_SPLITTER if self.hasSplitter else T_TO_SELECTOR
+			elif -1 <= self.loadState <= 3:
+				loaded = LOAD_STATES[self.loadState+1]
+			else:
+				loaded = T_INVALID_STATE
 
 			try:
-				connStat = T_STATE_INFO.format(
+				connStat = T_STATE_INFO % (
 					connStat,
 					self.device,
 					self.toolCount,
@@ -1335,7 +1621,7 @@ class SmuffCore():
 					self.tcCount,
 					durationAvg)
 			except Exception as err:
-				self._log.debug("Status parsing error: {0}".format(err))
+				self._log.debug("Status parsing error: %s", err)
 		return connStat
 
 	def get_fw_info(self, gcmd=None):
@@ -1345,10 +1631,10 @@ class SmuffCore():
 
 	def start_tc_timer(self):
 		self.tcCount +=1
-		self._tcStartTime = self._nowMS()
+		self._tcStartTime = now_ms()
 
 	def stop_tc_timer(self):
-		duration = (self._nowMS()-self._tcStartTime)/1000
+		duration = (now_ms()-self._tcStartTime)/1000
 		self.durationTotal += duration
 		return duration
 